@@ -0,0 +1,434 @@
+import itertools
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN ---
+# vlc (python-vlc) o mpv (proceso externo controlado por IPC JSON)
+AUDIO_BACKEND = os.getenv("AUDIO_BACKEND", "vlc")
+MPV_BINARY = os.getenv("MPV_BINARY", "mpv")
+# Pistas con objeto media de VLC creado por adelantado (el resto se crea al avanzar)
+QUEUE_WINDOW = int(os.getenv("QUEUE_WINDOW", 20))
+
+
+class AudioBackend:
+    """
+    Interfaz mínima de reproducción que usa SubsonicController.
+
+    Eventos emitidos con on(evento, callback):
+      - "playing" / "paused" / "stopped"
+      - "track_changed" (index=posición en la cola)
+      - "buffering" (percent=0-100)
+      - "track_stats" (stats=dict con bytes_read, input_kbps, demux_kbps,
+        lost_buffers; las claves que el backend no conozca faltan) al dejar
+        una pista
+      - "error"
+    Los callbacks se llaman desde el hilo del backend: deben ser rápidos.
+    """
+    name = None
+
+    def __init__(self):
+        self._listeners = {}
+
+    def on(self, event, callback):
+        self._listeners.setdefault(event, []).append(callback)
+
+    def _emit(self, event, **data):
+        for callback in self._listeners.get(event, ()):
+            try:
+                callback(**data)
+            except Exception as e:
+                log.error(event_log.PLAYBACK, f"❌ Error en callback '{event}': {e}")
+
+    def load_queue(self, urls, start_index=0, start_ms=0):
+        """Prepara la cola; play() arranca en start_index desde start_ms"""
+        raise NotImplementedError
+
+    def play(self):
+        raise NotImplementedError
+
+    def pause(self):
+        raise NotImplementedError
+
+    def resume(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def next(self):
+        raise NotImplementedError
+
+    def is_playing(self):
+        raise NotImplementedError
+
+    def position(self):
+        """Devuelve (índice, milisegundos, duración en ms); -1 si no se sabe"""
+        raise NotImplementedError
+
+    def release(self):
+        """Libera la cola y las conexiones de red, conservando el motor de audio"""
+        raise NotImplementedError
+
+    def set_volume(self, percent):
+        raise NotImplementedError
+
+    def twin(self):
+        """Segundo backend del mismo tipo para preparar el siguiente disco"""
+        return type(self)()
+
+    def close(self):
+        self.release()
+
+    def pids(self):
+        """Procesos que consumen recursos por este backend (para benchmarks)"""
+        return [os.getpid()]
+
+
+class VlcBackend(AudioBackend):
+    name = "vlc"
+
+    def __init__(self, instance=None):
+        super().__init__()
+        import vlc
+        # Usamos '--aout=alsa' si es necesario forzar, pero pipewire suele manejarlo bien
+        # Inicializamos el reproductor de LISTAS (MediaListPlayer)
+        # Un gemelo comparte la instancia (plugins y módulos ya cargados)
+        self._owns_instance = instance is None
+        self.instance = instance or vlc.Instance()
+        self.list_player = self.instance.media_list_player_new()
+        self.player = self.list_player.get_media_player() # Acceso al reproductor subyacente
+        self.media_list = None
+        self._urls = []
+        self._mrl_index = {}
+        self._loaded = 0           # pistas de la cola ya añadidas a media_list
+        self._extending = threading.Lock()
+        self._media = None         # media en reproducción, para sus estadísticas finales
+        self._media_stats = vlc.MediaStats()
+
+        events = self.player.event_manager()
+        events.event_attach(vlc.EventType.MediaPlayerPlaying, lambda e: self._emit("playing"))
+        events.event_attach(vlc.EventType.MediaPlayerPaused, lambda e: self._emit("paused"))
+        events.event_attach(vlc.EventType.MediaPlayerStopped, lambda e: self._emit("stopped"))
+        events.event_attach(vlc.EventType.MediaPlayerEncounteredError, lambda e: self._emit("error"))
+        events.event_attach(vlc.EventType.MediaPlayerBuffering,
+                            lambda e: self._emit("buffering", percent=e.u.new_cache))
+        list_events = self.list_player.event_manager()
+        list_events.event_attach(vlc.EventType.MediaListPlayerNextItemSet, self._on_next_item)
+
+    def _on_next_item(self, event):
+        # index_of_item() exige el lock de la lista, que VLC puede tener
+        # tomado durante el callback: resolvemos el índice con la MRL.
+        self._finish_media()
+        self._media = self.player.get_media()
+        index = self._current_index()
+        self._emit("track_changed", index=index)
+        # Cerca del final de la ventana: añadimos más pistas fuera del callback
+        if index >= self._loaded - 2 and self._loaded < len(self._urls):
+            threading.Thread(target=self._extend, args=(self.media_list,), daemon=True).start()
+
+    def _finish_media(self):
+        """Emite las estadísticas acumuladas por VLC para la pista que termina"""
+        media, self._media = self._media, None
+        if media is None or not media.get_stats(self._media_stats):
+            return
+        stats = self._media_stats
+        self._emit("track_stats", stats={
+            "bytes_read": stats.read_bytes,
+            # VLC da los bitrates en bytes por milisegundo
+            "input_kbps": round(stats.input_bitrate * 8000),
+            "demux_kbps": round(stats.demux_bitrate * 8000),
+            "lost_buffers": stats.lost_abuffers,
+            "corrupted": stats.demux_corrupted,
+            "discontinuities": stats.demux_discontinuity,
+        })
+
+    def _current_index(self):
+        media = self.player.get_media()
+        return self._mrl_index.get(media.get_mrl(), -1) if media else -1
+
+    def _add(self, media_list, index, start_ms=0):
+        media = self.instance.media_new(self._urls[index])
+        if start_ms > 0:
+            media.add_option(f"start-time={start_ms / 1000:.1f}")
+        media_list.add_media(media)
+        self._mrl_index[media.get_mrl()] = index
+
+    def _extend(self, media_list):
+        with self._extending:
+            # La cola se ha recargado o liberado desde que se pidió: no es la nuestra
+            if media_list is None or media_list is not self.media_list:
+                return
+            media_list.lock()
+            try:
+                end = min(self._loaded + QUEUE_WINDOW, len(self._urls))
+                for index in range(self._loaded, end):
+                    self._add(media_list, index)
+                self._loaded = end
+            finally:
+                media_list.unlock()
+
+    def load_queue(self, urls, start_index=0, start_ms=0):
+        # Solo se crea la media de una ventana de pistas: en colas largas
+        # (artistas, playlists) VLC no reserva cientos de objetos de golpe.
+        # La lista empieza en start_index; las anteriores ya no se necesitan.
+        # Con _extending tomado, una ampliación en curso no mezcla las dos colas.
+        with self._extending:
+            media_list = self.instance.media_list_new()
+            self._urls = urls
+            self._mrl_index = {}
+            end = min(start_index + QUEUE_WINDOW, len(urls))
+            for index in range(start_index, end):
+                self._add(media_list, index, start_ms if index == start_index else 0)
+            self._loaded = end
+
+            self.list_player.set_media_list(media_list)
+            if self.media_list is not None:
+                self.media_list.release()
+            self.media_list = media_list
+
+    def play(self):
+        self.list_player.play()
+
+    def pause(self):
+        self.player.set_pause(1)
+
+    def resume(self):
+        self.list_player.play()
+
+    def stop(self):
+        self._finish_media()
+        self.list_player.stop()
+
+    def next(self):
+        self.list_player.next()
+
+    def is_playing(self):
+        return bool(self.list_player.is_playing())
+
+    def position(self):
+        return self._current_index(), self.player.get_time(), self.player.get_length()
+
+    def release(self):
+        self._finish_media()
+        self.list_player.stop()
+        with self._extending:
+            if self.media_list is not None:
+                self.media_list.release()
+                self.media_list = None
+                self._mrl_index = {}
+                self._loaded = 0
+
+    def set_volume(self, percent):
+        self.player.audio_set_volume(int(percent))
+
+    def twin(self):
+        return VlcBackend(instance=self.instance)
+
+    def close(self):
+        self.release()
+        self.list_player.release()
+        if self._owns_instance:
+            self.instance.release()
+
+
+_mpv_ids = itertools.count()
+
+
+class MpvBackend(AudioBackend):
+    """
+    Backend ligero: un proceso mpv sin vídeo controlado por su IPC JSON.
+    Evita cargar libvlc y sus plugins en el proceso del tocadiscos.
+    """
+    name = "mpv"
+
+    def __init__(self, binary=MPV_BINARY, socket_path=None):
+        super().__init__()
+        self.socket_path = socket_path or os.path.join(
+            tempfile.gettempdir(), f"recordplayer-mpv-{os.getpid()}-{next(_mpv_ids)}.sock")
+        self.process = subprocess.Popen(
+            [binary, "--idle=yes", "--no-video", "--no-terminal",
+             f"--input-ipc-server={self.socket_path}"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        self._sock = self._connect()
+        self._write_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._paused = False
+        self._start = (0, 0)
+        self._bitrate = None       # último audio-bitrate observado
+
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        self._command("observe_property", 1, "playlist-pos")
+        self._command("observe_property", 2, "pause")
+        self._command("observe_property", 3, "paused-for-cache")
+        self._command("observe_property", 4, "audio-bitrate")
+
+    def _connect(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                return sock
+            except (FileNotFoundError, ConnectionRefusedError):
+                sock.close()
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    raise RuntimeError("mpv no ha abierto su socket IPC")
+                time.sleep(0.05)
+
+    # --- IPC ---
+
+    def _send(self, payload):
+        data = (json.dumps(payload) + "\n").encode()
+        with self._write_lock:
+            self._sock.sendall(data)
+
+    def _command(self, *args, timeout=5):
+        request_id = next(self._ids)
+        slot = [threading.Event(), None]
+        self._pending[request_id] = slot
+        self._send({"command": list(args), "request_id": request_id})
+        slot[0].wait(timeout)
+        self._pending.pop(request_id, None)
+
+        response = slot[1] or {"error": "timeout"}
+        if response.get("error") != "success":
+            raise RuntimeError(f"mpv {args[0]}: {response.get('error')}")
+        return response.get("data")
+
+    def _get(self, name, default=None):
+        try:
+            return self._command("get_property", name)
+        except RuntimeError:
+            return default
+
+    def _read_loop(self):
+        for line in self._sock.makefile("rb"):
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+
+            slot = self._pending.get(msg.get("request_id"))
+            if slot:
+                slot[1] = msg
+                slot[0].set()
+                continue
+
+            event = msg.get("event")
+            if event == "property-change":
+                name, value = msg.get("name"), msg.get("data")
+                if name == "playlist-pos" and value is not None and value >= 0:
+                    self._emit("track_changed", index=value)
+                elif name == "pause" and bool(value) != self._paused:
+                    self._paused = bool(value)
+                    self._emit("paused" if value else "playing")
+                elif name == "paused-for-cache" and value is not None:
+                    self._emit("buffering", percent=0 if value else 100)
+                elif name == "audio-bitrate" and value:
+                    self._bitrate = value
+            elif event == "file-loaded":
+                # La posición inicial solo aplica a la primera pista restaurada
+                self._send({"command": ["set_property", "start", "none"]})
+            elif event == "playback-restart":
+                # Empieza (o vuelve) a sonar: el buffer está listo
+                self._emit("buffering", percent=100)
+                if not self._paused:
+                    self._emit("playing")
+            elif event == "end-file":
+                # mpv no expone contadores de bytes por fichero: solo el bitrate
+                bitrate, self._bitrate = self._bitrate, None
+                self._emit("track_stats", stats={"demux_kbps": round(bitrate / 1000)} if bitrate else {})
+                if msg.get("reason") == "error":
+                    self._emit("error")
+            elif event == "idle":
+                self._emit("stopped")
+
+    # --- INTERFAZ ---
+
+    def load_queue(self, urls, start_index=0, start_ms=0):
+        self._command("stop")
+        self._command("playlist-clear")
+        for url in urls:
+            self._command("loadfile", url, "append")
+        self._start = (start_index, start_ms)
+
+    def play(self):
+        index, start_ms = self._start
+        if start_ms > 0:
+            self._command("set_property", "start", f"+{start_ms / 1000:.1f}")
+        self._command("set_property", "pause", False)
+        self._command("playlist-play-index", index)
+
+    def pause(self):
+        self._command("set_property", "pause", True)
+
+    def resume(self):
+        self._command("set_property", "pause", False)
+
+    def stop(self):
+        self._command("stop")
+
+    def next(self):
+        self._command("playlist-next", "force")
+
+    def is_playing(self):
+        return not self._paused and self._get("idle-active", True) is False
+
+    def position(self):
+        index = self._get("playlist-pos", -1)
+        seconds = self._get("time-pos")
+        duration = self._get("duration")
+        return (
+            index,
+            int(seconds * 1000) if seconds is not None else -1,
+            int(duration * 1000) if duration is not None else -1,
+        )
+
+    def release(self):
+        # mpv cierra el stream HTTP al parar; vaciamos la cola para soltar memoria
+        self._command("stop")
+        self._command("playlist-clear")
+
+    def set_volume(self, percent):
+        self._command("set_property", "volume", percent)
+
+    def close(self):
+        try:
+            self._command("quit", timeout=1)
+        except (RuntimeError, OSError):
+            pass
+        self.process.wait(timeout=5)
+        self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def pids(self):
+        return [os.getpid(), self.process.pid]
+
+
+BACKENDS = {
+    VlcBackend.name: VlcBackend,
+    MpvBackend.name: MpvBackend,
+}
+
+
+def create_backend(name=AUDIO_BACKEND):
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend de audio desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    log.info(event_log.PLAYBACK, f"🔈 Backend de audio: {name}")
+    return backend_class()
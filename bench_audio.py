@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from audio_backends import BACKENDS, create_backend
+
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+def rss_kb(pids):
+    """Suma VmRSS (kB) de los procesos indicados"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def cpu_seconds(pids):
+    """Suma utime + stime de los procesos indicados"""
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                # El nombre del proceso puede tener espacios: partimos tras ')'
+                fields = f.read().rsplit(")", 1)[1].split()
+                total += int(fields[11]) + int(fields[12])
+        except FileNotFoundError:
+            pass
+    return total / CLK_TCK
+
+
+def measure(name, url, seconds):
+    """Se ejecuta en un proceso hijo limpio para que las cifras no se mezclen"""
+    base_rss = rss_kb([os.getpid()])
+    t0 = time.monotonic()
+    backend = create_backend(name)
+    init_ms = (time.monotonic() - t0) * 1000
+    pids = backend.pids()
+    idle_rss = rss_kb(pids)
+
+    backend.load_queue([url])
+    t0 = time.monotonic()
+    backend.play()
+
+    # Tiempo hasta el primer audio: la posición empieza a avanzar
+    ttfa_ms = None
+    while time.monotonic() - t0 < 30:
+        _, position, _ = backend.position()
+        if position > 0:
+            ttfa_ms = (time.monotonic() - t0) * 1000
+            break
+        time.sleep(0.01)
+
+    cpu_start = cpu_seconds(pids)
+    time.sleep(seconds)
+    cpu_used = cpu_seconds(pids) - cpu_start
+    playing_rss = rss_kb(pids)
+    backend.close()
+
+    return {
+        "backend": name,
+        "init_ms": round(init_ms, 1),
+        "ttfa_ms": round(ttfa_ms, 1) if ttfa_ms is not None else None,
+        "rss_base_kb": base_rss,
+        "rss_idle_kb": idle_rss,
+        "rss_playing_kb": playing_rss,
+        "cpu_percent": round(cpu_used / seconds * 100, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara RSS, CPU y tiempo hasta el primer audio entre backends")
+    parser.add_argument("url", help="URL de stream (p.ej. .../rest/stream?id=...&u=...&t=...&s=...)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Lista separada por comas")
+    parser.add_argument("--seconds", type=float, default=10, help="Segundos de reproducción medidos")
+    parser.add_argument("--json", action="store_true", help="Salida JSON en una línea por backend")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.url, args.seconds)))
+        return
+
+    results = []
+    for name in args.backends.split(","):
+        proc = subprocess.run(
+            [sys.executable, __file__, args.url, "--child", name, "--seconds", str(args.seconds)],
+            capture_output=True, text=True
+        )
+        lines = proc.stdout.strip().splitlines()
+        if proc.returncode != 0 or not lines:
+            results.append({"backend": name, "error": proc.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(lines[-1]))
+
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+
+    print(f"{'backend':<8} {'init ms':>8} {'TTFA ms':>8} {'RSS idle':>9} {'RSS play':>9} {'CPU %':>6}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['backend']:<8} ❌ {r['error']}")
+            continue
+        print(f"{r['backend']:<8} {r['init_ms']:>8} {r['ttfa_ms'] or '-':>8} "
+              f"{r['rss_idle_kb']:>7}kB {r['rss_playing_kb']:>7}kB {r['cpu_percent']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+from tracks import Track
+
+# --- PRESUPUESTOS ---
+# Bytes de heap de Python retenidos por pista en cola (Track + URL de stream)
+TRACK_BYTES_BUDGET = 450
+# Crecimiento de RSS por pista encolada, incluido el pico al decodificar la respuesta
+RSS_BYTES_BUDGET = 2048
+
+
+def fake_song(i, rng):
+    """Canción con los campos que devuelve un servidor Subsonic/Navidrome"""
+    artist = f"Artista {rng.randint(1, 40)}"
+    album_id = f"al-{rng.randint(1, 400):06x}"
+    return {
+        "id": f"{rng.getrandbits(64):016x}",
+        "parent": album_id,
+        "isDir": False,
+        "title": f"Canción número {i}",
+        "album": f"Álbum {album_id}",
+        "artist": artist,
+        "track": i % 14 + 1,
+        "year": rng.randint(1960, 2024),
+        "genre": "Rock",
+        "coverArt": f"mf-{album_id}",
+        "size": rng.randint(3_000_000, 12_000_000),
+        "contentType": "audio/flac",
+        "suffix": "flac",
+        "duration": rng.randint(120, 480),
+        "bitRate": 920,
+        "path": f"{artist}/{album_id}/{i:02d} - Canción número {i}.flac",
+        "playCount": rng.randint(0, 50),
+        "discNumber": 1,
+        "created": "2024-03-01T10:00:00.000Z",
+        "albumId": album_id,
+        "artistId": f"ar-{rng.randint(1, 40):06x}",
+        "type": "music",
+        "isVideo": False,
+        "bpm": 0,
+        "comment": "",
+        "sortName": f"canción número {i}",
+        "mediaType": "song",
+        "musicBrainzId": "",
+        "channelCount": 2,
+        "samplingRate": 44100,
+    }
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(build, n):
+    """Bytes de heap retenidos por el resultado de build()"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = build()
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return result, retained / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por pista encolada (tracemalloc + RSS)")
+    parser.add_argument("--tracks", type=int, default=5000, help="Pistas en la cola simulada")
+    parser.add_argument("--history", help="Añade el resultado (JSON) a este fichero para seguir su evolución")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    # Respuesta JSON tal cual llega del servidor: cada prueba la decodifica de nuevo
+    raw = json.dumps([fake_song(i, rng) for i in range(args.tracks)])
+    auth = "u=usuario&t=0123456789abcdef0123456789abcdef&s=abcdef&v=1.16.1&c=RPiPlayer"
+    server = "https://music.example.com:443"
+
+    # Ahora: Track compacto + URL de stream (lo que recibe el backend)
+    def build_queue():
+        tracks = [Track.from_song(song) for song in json.loads(raw)]
+        urls = [f"{server}/rest/stream?id={track.id}&{auth}" for track in tracks]
+        return tracks, urls
+
+    # RSS primero y sin tracemalloc activo (su propia contabilidad también ocupa memoria)
+    gc.collect()
+    rss_before = rss_kb()
+    queue = build_queue()
+    gc.collect()
+    rss_bytes = (rss_kb() - rss_before) * 1024 / args.tracks
+
+    # Antes: la cola guardaba los diccionarios completos
+    _, dict_bytes = measure(lambda: json.loads(raw), args.tracks)
+    _, track_bytes = measure(build_queue, args.tracks)
+
+    result = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "tracks": args.tracks,
+        "dict_bytes_per_track": round(dict_bytes),
+        "track_bytes_per_track": round(track_bytes),
+        "rss_bytes_per_track": round(rss_bytes),
+    }
+
+    print(f"📦 {args.tracks} pistas en cola")
+    print(f"   dict de Subsonic : {dict_bytes:>7.0f} B/pista")
+    print(f"   Track + URL      : {track_bytes:>7.0f} B/pista (presupuesto {TRACK_BYTES_BUDGET})")
+    print(f"   Crecimiento RSS  : {rss_bytes:>7.0f} B/pista (presupuesto {RSS_BYTES_BUDGET})")
+
+    if args.history:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+    failed = track_bytes > TRACK_BYTES_BUDGET or rss_bytes > RSS_BYTES_BUDGET
+    if failed:
+        print("❌ Presupuesto de memoria superado")
+    else:
+        print("✅ Dentro del presupuesto")
+    del queue
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
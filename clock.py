@@ -0,0 +1,60 @@
+import threading
+import time
+
+
+class Clock:
+    """Reloj real: la fuente de tiempo que se inyecta en el reproductor y los dispositivos"""
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, timeout=None):
+        """Espera a un threading.Event como máximo timeout segundos"""
+        return event.wait(timeout)
+
+
+class VirtualClock(Clock):
+    """
+    Reloj simulado para pruebas deterministas: sleep() no espera, solo
+    adelanta el tiempo. Una línea de tiempo de minutos se ejecuta en
+    milisegundos y siempre produce el mismo resultado.
+
+    Pensado para escenarios de un solo hilo (el bucle de main_test con
+    dispositivos simulados); los hilos reales no se sincronizan con él.
+    """
+
+    EPOCH = 1_700_000_000.0
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self):
+        return self.EPOCH + self._now
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += max(seconds, 0)
+
+    def wait(self, event, timeout=None):
+        if event.is_set():
+            return True
+        if timeout is None:
+            raise RuntimeError("Esperar sin timeout con un reloj virtual bloquearía para siempre")
+        self.advance(timeout)
+        return event.is_set()
+
+
+REAL_CLOCK = Clock()
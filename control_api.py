@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import event_log
+from event_log import log
+
+# Socket Unix local (vacío = API desactivada)
+CONTROL_SOCKET = os.getenv("CONTROL_SOCKET", "/tmp/recordplayer.sock")
+
+HELP = "Comandos: status | stats | pause | resume | skip | play <uri> | reload | events [n]"
+
+
+class ControlServer:
+    """
+    API de control y estado sobre un socket Unix (una línea por comando,
+    respuesta JSON en una línea).
+
+    Corre en su propio hilo con un bucle asyncio, así que no añade trabajo a
+    RecordPlayer.update(): el estado se lee de atributos ya existentes y las
+    órdenes que tocan el audio se ejecutan en un worker propio, en serie. El
+    SubsonicController las serializa con su lock frente al bucle principal.
+    """
+
+    def __init__(self, player, path=CONTROL_SOCKET):
+        self.player = player
+        self.audio = player.audio
+        self.path = path
+        self._loop = None
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="control")
+
+    # --- ESTADO ---
+
+    def status(self):
+        return {
+            "tag": self.player.current_rfid,
+            "spinning": self.player.spinning,
+            "idle": self.player.idle,
+            "audio": self.audio.status(),
+            "log": {"buffered": len(log), "dropped": log.dropped},
+        }
+
+    # --- COMANDOS ---
+
+    def _execute(self, cmd, arg):
+        if cmd == "status":
+            return self.status()
+        if cmd == "stats":
+            # Telemetría de streaming: atascos y bitrates por servidor/formato
+            return self.audio.playback.status()
+        if cmd == "pause":
+            self.audio.pause()
+        elif cmd == "resume":
+            self.audio.resume()
+        elif cmd == "skip":
+            self.audio.next()
+        elif cmd == "play":
+            if not arg:
+                raise ValueError("Falta la URI (subsonic:tipo:id)")
+            self.audio.play_uri(arg)
+        elif cmd == "reload":
+            self.audio.reload_rfid_map()
+        elif cmd == "events":
+            n = int(arg) if arg else event_log.LOG_DUMP_SIZE
+            return [event_log.EventLog.format(e) for e in log.dump(n)]
+        else:
+            raise ValueError(HELP)
+        return {"ok": True}
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd, _, arg = line.decode().strip().partition(" ")
+                if not cmd:
+                    continue
+                try:
+                    result = await loop.run_in_executor(self._executor, self._execute, cmd.lower(), arg.strip())
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(response, default=str) + "\n").encode())
+                await writer.drain()
+        finally:
+            writer.close()
+
+    # --- CICLO DE VIDA ---
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = self._loop.run_until_complete(asyncio.start_unix_server(self._handle, path=self.path))
+        log.info(event_log.SYSTEM, f"🛰️ API de control escuchando en {self.path}")
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.close()
+
+    def start(self):
+        if not self.path:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=2)
+        self._executor.shutdown(wait=False)
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def send_command(line, path=CONTROL_SOCKET, timeout=30):
+    """Cliente mínimo: envía un comando y devuelve la respuesta decodificada"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((line.strip() + "\n").encode())
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+if __name__ == "__main__":
+    # Uso: python control_api.py status | skip | play subsonic:album:123 ...
+    if len(sys.argv) < 2:
+        print(HELP)
+        sys.exit(1)
+    print(json.dumps(send_command(" ".join(sys.argv[1:])), indent=2, ensure_ascii=False))
@@ -0,0 +1,180 @@
+import atexit
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+# --- NIVELES ---
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# --- TIPOS DE EVENTO ---
+TAG = "tag"
+ARM = "arm"
+FETCH = "fetch"
+PLAYBACK = "playback"
+MOTOR = "motor"
+SYSTEM = "system"
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_CAPACITY = int(os.getenv("LOG_CAPACITY", 2048))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 1.0))
+LOG_DUMP_FILE = os.getenv("LOG_DUMP_FILE", "events_dump.log")
+LOG_DUMP_SIZE = int(os.getenv("LOG_DUMP_SIZE", 200))
+
+Event = namedtuple("Event", "seq ts level kind msg data")
+
+
+def parse_level(level):
+    """Acepta un nivel numérico o su nombre ('info', 'DEBUG'...)"""
+    if isinstance(level, int):
+        return level
+    if str(level).isdigit():
+        return int(level)
+    for value, name in LEVEL_NAMES.items():
+        if name == str(level).upper():
+            return value
+    return INFO
+
+
+class EventLog:
+    """
+    Registro estructurado de eventos sobre un buffer circular en memoria.
+
+    Registrar un evento solo construye una tupla y la añade a un deque con
+    maxlen: ambas operaciones son atómicas bajo el GIL, así que el bucle de
+    control y el hilo del motor nunca esperan un lock ni tocan la tarjeta SD.
+    Un hilo en segundo plano vuelca los eventos nuevos por lotes.
+    """
+
+    def __init__(self, capacity=LOG_CAPACITY, level=LOG_LEVEL,
+                 flush_interval=LOG_FLUSH_INTERVAL, stream=None):
+        self.level = parse_level(level)
+        self.flush_interval = flush_interval
+        self.stream = stream
+        self._ring = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._last_flushed = 0
+        self._missing = set()   # huecos del último volcado (pueden llegar tarde)
+        self.dropped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- REGISTRO (camino rápido) ---
+
+    def emit(self, level, kind, msg, **data):
+        self._ring.append(Event(next(self._seq), time.time(), level, kind, msg, data))
+
+    def debug(self, kind, msg, **data):
+        self._ring.append(Event(next(self._seq), time.time(), DEBUG, kind, msg, data))
+
+    def info(self, kind, msg, **data):
+        self._ring.append(Event(next(self._seq), time.time(), INFO, kind, msg, data))
+
+    def warning(self, kind, msg, **data):
+        self._ring.append(Event(next(self._seq), time.time(), WARNING, kind, msg, data))
+
+    def error(self, kind, msg, **data):
+        self._ring.append(Event(next(self._seq), time.time(), ERROR, kind, msg, data))
+
+    # --- VOLCADO ---
+
+    def _snapshot(self):
+        # deque.copy() se ejecuta íntegramente en C: es una foto consistente
+        # del buffer aunque otros hilos sigan añadiendo eventos.
+        return self._ring.copy()
+
+    def flush(self):
+        """Escribe los eventos pendientes con nivel >= self.level"""
+        missing = self._missing
+        events = [e for e in self._snapshot() if e.seq > self._last_flushed or e.seq in missing]
+        if not events and not missing:
+            return
+
+        # El número y el append no son una sola operación: dos hilos pueden
+        # dejar sus eventos en el buffer fuera de orden. Un hueco se espera un
+        # volcado más (el evento llega tarde y se escribe entonces); si sigue
+        # faltando, se perdió porque el buffer dio la vuelta.
+        events.sort(key=lambda e: e.seq)
+        seen = {e.seq for e in events}
+        lost = len(missing - seen)
+        last = max(self._last_flushed, events[-1].seq if events else 0)
+        self._missing = set(range(self._last_flushed + 1, last + 1)) - seen
+        self._last_flushed = last
+        if lost > 0:
+            self.dropped += lost
+
+        lines = [self.format(e) for e in events if e.level >= self.level]
+        if lost > 0:
+            lines.insert(0, f"⚠️ {lost} eventos descartados (buffer lleno)")
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        """Arranca el hilo de volcado por lotes"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        self.flush()
+
+    def __len__(self):
+        return len(self._ring)
+
+    # --- POST-MORTEM ---
+
+    def dump(self, n=None):
+        """Devuelve los últimos n eventos (todos los niveles)"""
+        events = list(self._snapshot())
+        return events if n is None else events[-n:]
+
+    def dump_to_file(self, path=LOG_DUMP_FILE, n=LOG_DUMP_SIZE):
+        with open(path, "w") as f:
+            for event in self.dump(n):
+                f.write(self.format(event) + "\n")
+        return path
+
+    @staticmethod
+    def format(event):
+        stamp = time.strftime("%H:%M:%S", time.localtime(event.ts))
+        millis = int((event.ts % 1) * 1000)
+        line = f"{stamp}.{millis:03d} {LEVEL_NAMES.get(event.level, event.level):<7} [{event.kind}] {event.msg}"
+        if event.data:
+            line += " " + " ".join(f"{k}={v}" for k, v in event.data.items())
+        return line
+
+
+# Instancia compartida por todo el proyecto
+log = EventLog()
+
+
+if __name__ == "__main__":
+    # Mide el coste por evento en el camino rápido
+    bench = EventLog(capacity=4096)
+    n = 200_000
+    start = time.perf_counter()
+    for i in range(n):
+        bench.info(TAG, "Etiqueta detectada", rfid=i)
+    elapsed = time.perf_counter() - start
+    print(f"⏱️ {n} eventos en {elapsed * 1000:.1f} ms -> {elapsed / n * 1e9:.0f} ns/evento")
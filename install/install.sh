@@ -56,15 +56,37 @@ sudo sed -i 's/^dtparam=spi=.*/dtparam=spi=on/' /boot/config.txt
 sudo sed -i 's/^#dtparam=spi=.*/dtparam=spi=on/' /boot/config.txt
 sudo raspi-config nonint do_spi 0
 
-# 6. CREAR SERVICIO SYSTEMD (AUTO-ARRANQUE)
+# 6. CREAR SERVICIOS SYSTEMD (AUTO-ARRANQUE)
 echo "⚙️ Configurando servicio de auto-arranque (systemd)..."
+BROKER_SERVICE_FILE="/etc/systemd/system/rfid-broker.service"
 SERVICE_FILE="/etc/systemd/system/recordplayer.service"
 
+# Broker del lector RFID: único proceso que usa el RC522 (SPI). El reproductor
+# y install/setup_subsonic.py se suscriben a él, así que programar etiquetas
+# ya no obliga a parar el reproductor.
+sudo bash -c "cat > $BROKER_SERVICE_FILE" <<EOF
+[Unit]
+Description=RFID Record Player - lector RC522 compartido
+
+[Service]
+Type=simple
+User=$USER
+WorkingDirectory=$PROJECT_ROOT
+ExecStart=$PROJECT_ROOT/venv/bin/python $PROJECT_ROOT/rfid_broker.py
+Restart=always
+RestartSec=2
+Environment=PYTHONUNBUFFERED=1
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
 # Creamos el archivo del servicio dinámicamente con las rutas correctas
 sudo bash -c "cat > $SERVICE_FILE" <<EOF
 [Unit]
 Description=Navidrome RFID Record Player
-After=network.target sound.target bluetooth.target
+After=network.target sound.target bluetooth.target rfid-broker.service
+Wants=rfid-broker.service
 
 [Service]
 Type=simple
@@ -85,11 +107,12 @@ EOF
 
 # Recargar demonio y habilitar servicio
 sudo systemctl daemon-reload
+sudo systemctl enable rfid-broker.service
 sudo systemctl enable recordplayer.service
 
 # Crear archivo env
 # Pedir datos al usuario
-read -p "Introduce la URL de Subsonic: " SUBSONIC_URL
+read -p "Introduce la URL de Subsonic (varias separadas por comas, p.ej. LAN y pública): " SUBSONIC_URL
 read -p "Introduce el puerto de Subsonic: " SUBSONIC_PORT
 read -p "Introduce el usuario de Navidrome: " SUBSONIC_USER
 read -s -p "Introduce la contraseña de Navidrome: " SUBSONIC_PASS
@@ -110,7 +133,7 @@ echo "==========================================="
 echo "✅ INSTALACIÓN COMPLETADA"
 echo "==========================================="
 echo "Pasos siguientes:"
-echo "1. Ejecuta 'python3 install/setup_bluetooth.py' para conectar tus cascos."
+echo "1. Ejecuta 'sudo venv/bin/python install/setup_bluetooth.py' para conectar tus cascos."
 echo "2. Reinicia la Raspberry Pi ('sudo reboot')."
 echo "3. ¡El tocadiscos arrancará solo!"
 echo ""
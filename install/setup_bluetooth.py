@@ -1,14 +1,18 @@
+import argparse
+import asyncio
 import subprocess
 import time
 import sys
 import os
 
-def run_command(command):
-    """Ejecuta comando y devuelve salida, ignorando errores no críticos."""
-    try:
-        return subprocess.check_output(command, shell=True, stderr=subprocess.DEVNULL).decode('utf-8')
-    except:
-        return ""
+# Tiempo máximo de escaneo (se puede elegir dispositivo antes)
+SCAN_TIME = 60
+# Tiempo máximo de cada paso: emparejar, confiar, conectar
+STEP_TIMEOUT = 30
+
+BLUEZ = "org.bluez"
+AGENT_PATH = "/recordplayer/agent"
+
 
 def ensure_bluetooth_ready():
     print("🔄 Reiniciando servicio Bluetooth...")
@@ -28,78 +32,582 @@ def ensure_bluetooth_ready():
     time.sleep(2)
 
 
-def scan_devices(timeout=SCAN_TIME):
-    print(f"\n🔍 Escaneando dispositivos ({timeout}s)...")
+def _make_agent():
+    """Agente "NoInputNoOutput": acepta el emparejamiento sin pedir PIN (cascos, altavoces)"""
+    from dbus_next.service import ServiceInterface, method
 
-    process = subprocess.Popen(
-        ["bluetoothctl"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True,
-        bufsize=1
-    )
+    class Agent(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.bluez.Agent1")
+
+        @method()
+        def Release(self):
+            pass
+
+        @method()
+        def RequestPinCode(self, device: 'o') -> 's':
+            return "0000"
+
+        @method()
+        def RequestPasskey(self, device: 'o') -> 'u':
+            return 0
+
+        @method()
+        def DisplayPinCode(self, device: 'o', pincode: 's'):
+            pass
+
+        @method()
+        def DisplayPasskey(self, device: 'o', passkey: 'u', entered: 'q'):
+            pass
+
+        @method()
+        def RequestConfirmation(self, device: 'o', passkey: 'u'):
+            pass
+
+        @method()
+        def RequestAuthorization(self, device: 'o'):
+            pass
+
+        @method()
+        def AuthorizeService(self, device: 'o', uuid: 's'):
+            pass
+
+        @method()
+        def Cancel(self):
+            pass
+
+    return Agent()
+
+
+class Bluez:
+    """
+    Cliente asíncrono de BlueZ por D-Bus (dbus-next). Los dispositivos
+    llegan con la señal InterfacesAdded en cuanto BlueZ los descubre, y
+    emparejar/conectar esperan a la respuesta del método o al cambio de
+    propiedad correspondiente, sin pausas fijas.
+
+    bus_address apunta a otro bus (el privado de FakeBluez) en vez del de sistema.
+    """
+
+    def __init__(self, bus_address=None):
+        self.bus_address = bus_address
+
+    async def open(self):
+        from dbus_next import BusType
+        from dbus_next.aio import MessageBus
+
+        self.bus = await MessageBus(bus_address=self.bus_address, bus_type=BusType.SYSTEM).connect()
+        root = await self._proxy("/")
+        self.manager = root.get_interface("org.freedesktop.DBus.ObjectManager")
+        objects = await self.manager.call_get_managed_objects()
+        self.adapter_path = next((path for path, ifaces in objects.items() if "org.bluez.Adapter1" in ifaces), None)
+        if self.adapter_path is None:
+            raise RuntimeError("No hay ningún adaptador Bluetooth")
+        self._known = {path: ifaces["org.bluez.Device1"] for path, ifaces in objects.items()
+                       if "org.bluez.Device1" in ifaces and path.startswith(self.adapter_path + "/")}
+
+        adapter = await self._proxy(self.adapter_path)
+        self.adapter = adapter.get_interface("org.bluez.Adapter1")
+        await self.adapter.set_powered(True)
+
+        self.bus.export(AGENT_PATH, _make_agent())
+        agents = (await self._proxy("/org/bluez")).get_interface("org.bluez.AgentManager1")
+        await agents.call_register_agent(AGENT_PATH, "NoInputNoOutput")
+        await agents.call_request_default_agent(AGENT_PATH)
+
+    async def _proxy(self, path):
+        return self.bus.get_proxy_object(BLUEZ, path, await self.bus.introspect(BLUEZ, path))
+
+    @staticmethod
+    def _describe(props):
+        value = lambda key: props[key].value if key in props else None
+        return value("Address"), value("Alias") or value("Name") or value("Address"), value("RSSI")
+
+    async def start_discovery(self, on_device):
+        """on_device(mac, nombre, rssi) por cada dispositivo, según aparece"""
+        def added(path, interfaces):
+            if "org.bluez.Device1" in interfaces and path.startswith(self.adapter_path + "/"):
+                on_device(*self._describe(interfaces["org.bluez.Device1"]))
+
+        self.manager.on_interfaces_added(added)
+        # Los ya conocidos (emparejados antes) también se pueden elegir
+        for props in self._known.values():
+            on_device(*self._describe(props))
+        await self.adapter.call_start_discovery()
+
+    async def stop_discovery(self):
+        try:
+            await self.adapter.call_stop_discovery()
+        except Exception:
+            pass
+
+    async def _device(self, mac):
+        path = f"{self.adapter_path}/dev_{mac.replace(':', '_')}"
+        proxy = await self._proxy(path)
+        return proxy.get_interface("org.bluez.Device1"), proxy.get_interface("org.freedesktop.DBus.Properties")
+
+    async def pair(self, mac):
+        device, _ = await self._device(mac)
+        if not await device.get_paired():
+            # Pair() responde cuando el emparejamiento ha terminado (o ha fallado)
+            await device.call_pair()
+
+    async def trust(self, mac):
+        device, _ = await self._device(mac)
+        await device.set_trusted(True)
+
+    async def connect(self, mac):
+        device, properties = await self._device(mac)
+        connected = asyncio.get_running_loop().create_future()
+
+        def changed(interface, values, invalidated):
+            if "Connected" in values and values["Connected"].value and not connected.done():
+                connected.set_result(True)
+
+        properties.on_properties_changed(changed)
+        try:
+            await device.call_connect()
+            # Connect() puede volver antes de que el perfil de audio esté arriba
+            if not await device.get_connected():
+                await connected
+        finally:
+            properties.off_properties_changed(changed)
+
+    async def close(self):
+        self.bus.disconnect()
+
+
+# Bus privado para FakeBluez (sin política de sistema: cualquiera puede registrar nombres)
+FAKE_BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-BUS Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:dir={dir}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+"""
+
+
+def _make_fake_device(path, mac, name, rssi):
+    """Objeto org.bluez.Device1 mínimo con las propiedades que usa Bluez"""
+    from dbus_next.service import ServiceInterface, dbus_property, method
+    from dbus_next.constants import PropertyAccess
+
+    class Device(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.bluez.Device1")
+            self.path = path
+            self.mac = mac
+            self.alias = name       # self.name es el nombre de la interfaz
+            self.rssi = rssi
+            self.paired = False
+            self.trusted = False
+            self.connected = False
+
+        def set_connected(self, value):
+            self.connected = value
+            self.emit_properties_changed({"Connected": value})
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Address(self) -> 's':
+            return self.mac
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Alias(self) -> 's':
+            return self.alias
+
+        @dbus_property(access=PropertyAccess.READ)
+        def RSSI(self) -> 'n':
+            return self.rssi
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Paired(self) -> 'b':
+            return self.paired
+
+        @dbus_property()
+        def Trusted(self) -> 'b':
+            return self.trusted
+
+        @Trusted.setter
+        def Trusted(self, value: 'b'):
+            self.trusted = value
+
+        @dbus_property(access=PropertyAccess.READ)
+        def Connected(self) -> 'b':
+            return self.connected
+
+        # Pair() y Connect() los atiende FakeBluez._on_message: la respuesta
+        # llega cuando el paso ha terminado, como en BlueZ
+        @method()
+        def Pair(self):
+            pass
+
+        @method()
+        def Connect(self):
+            pass
+
+    return Device()
 
-    devices = {}
 
-    def send(cmd):
-        process.stdin.write(cmd + "\n")
-        process.stdin.flush()
+def _make_fake_adapter(bluez):
+    from dbus_next.service import ServiceInterface, dbus_property, method
 
-    send("agent on")
-    send("default-agent")
-    send("scan on")
+    class Adapter(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.bluez.Adapter1")
+            self.powered = False
 
-    start = time.time()
+        @dbus_property()
+        def Powered(self) -> 'b':
+            return self.powered
 
-    while time.time() - start < timeout:
-        line = process.stdout.readline()
-        if not line:
-            continue
+        @Powered.setter
+        def Powered(self, value: 'b'):
+            self.powered = value
 
-        # DEBUG opcional:
-        # print("DEBUG:", line.strip())
+        @method()
+        def StartDiscovery(self):
+            bluez.start_discovery()
 
-        match = re.search(r"Device ([0-9A-F:]{17}) (.+)", line)
-        if match:
-            mac, name = match.groups()
-            devices[mac] = name
+        @method()
+        def StopDiscovery(self):
+            bluez.stop_discovery()
 
-    send("scan off")
-    send("exit")
-    process.wait()
+    return Adapter()
+
+
+def _make_fake_agent_manager(bluez):
+    from dbus_next.service import ServiceInterface, method
+
+    class AgentManager(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.bluez.AgentManager1")
+
+        @method()
+        def RegisterAgent(self, agent: 'o', capability: 's'):
+            bluez.agent_path = agent
+            bluez.capability = capability
+
+        @method()
+        def RequestDefaultAgent(self, agent: 'o'):
+            pass
+
+    return AgentManager()
+
+
+def _make_fake_root():
+    # Cualquier interfaz en "/" hace que la introspección anuncie el ObjectManager
+    from dbus_next.service import ServiceInterface
+
+    class Root(ServiceInterface):
+        def __init__(self):
+            super().__init__("org.recordplayer.FakeBluez")
+
+    return Root()
+
+
+class FakeBluez:
+    """
+    BlueZ simulado (--fake, --self-test) sobre un dbus-daemon privado: publica
+    org.bluez con ObjectManager, AgentManager1, Adapter1 y Device1 mínimos,
+    y la clase Bluez real se conecta a él. Así se prueban la señal
+    InterfacesAdded (y su filtro por adaptador), el registro del agente, la
+    espera a la respuesta de Pair() y al cambio de la propiedad Connected,
+    sin adaptador ni root.
+    """
+
+    ADAPTER = "/org/bluez/hci0"
+    # (retardo, adaptador, MAC, nombre, RSSI): el de hci1 no debe aparecer
+    DEVICES = (
+        (0.3, "/org/bluez/hci0", "11:22:33:44:55:01", "Televisión salón", -80),
+        (0.5, "/org/bluez/hci1", "11:22:33:44:55:09", "Otro adaptador", -50),
+        (0.8, "/org/bluez/hci0", "11:22:33:44:55:02", "Cascos BT", -45),
+        (1.5, "/org/bluez/hci0", "11:22:33:44:55:03", "Altavoz cocina", -60),
+    )
+    # Emparejamiento que el dispositivo rechaza
+    REJECTS = ("11:22:33:44:55:03",)
+
+    def __init__(self, step_delay=0.2):
+        self.step_delay = step_delay
+        self.address = None
+        self.agent_path = None
+        self.capability = None
+        self.agent_calls = []
+        self.devices = {}           # MAC -> objeto Device1 exportado
+        self._agent_owner = None
+        self._daemon = None
+        self._tmp = None
+        self._task = None
+        self._pending = set()
+
+    async def start(self):
+        import tempfile
+        from dbus_next.aio import MessageBus
+
+        self._tmp = tempfile.TemporaryDirectory(prefix="fakebluez-")
+        config = os.path.join(self._tmp.name, "bus.conf")
+        with open(config, "w") as f:
+            f.write(FAKE_BUS_CONFIG.format(dir=self._tmp.name))
+        self._daemon = await asyncio.create_subprocess_exec(
+            "dbus-daemon", f"--config-file={config}", "--nofork", "--print-address",
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        self.address = (await self._daemon.stdout.readline()).decode().strip()
+
+        self.bus = await MessageBus(bus_address=self.address).connect()
+        self.bus.add_message_handler(self._on_message)
+        self.bus.export("/", _make_fake_root())
+        self.bus.export("/org/bluez", _make_fake_agent_manager(self))
+        self.bus.export(self.ADAPTER, _make_fake_adapter(self))
+        self.bus.export("/org/bluez/hci1", _make_fake_adapter(self))
+        await self.bus.request_name(BLUEZ)
+
+    async def stop(self):
+        self.stop_discovery()
+        self.bus.disconnect()
+        self._daemon.terminate()
+        await self._daemon.wait()
+        self._tmp.cleanup()
+
+    # --- DESCUBRIMIENTO ---
+
+    def start_discovery(self):
+        async def discover():
+            started = time.monotonic()
+            for delay, adapter, mac, name, rssi in self.DEVICES:
+                await asyncio.sleep(max(0, started + delay - time.monotonic()))
+                if mac not in self.devices:
+                    self._add_device(adapter, mac, name, rssi)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(discover())
+
+    def stop_discovery(self):
+        if self._task:
+            self._task.cancel()
+
+    def _add_device(self, adapter, mac, name, rssi):
+        from dbus_next import Message, Variant
+
+        path = f"{adapter}/dev_{mac.replace(':', '_')}"
+        device = _make_fake_device(path, mac, name, rssi)
+        self.devices[mac] = device
+        self.bus.export(path, device)
+        # BlueZ anuncia los objetos nuevos desde "/", donde está su ObjectManager
+        props = {"Address": Variant("s", mac), "Alias": Variant("s", name), "RSSI": Variant("n", rssi),
+                 "Paired": Variant("b", False), "Trusted": Variant("b", False), "Connected": Variant("b", False)}
+        self.bus.send(Message.new_signal("/", "org.freedesktop.DBus.ObjectManager", "InterfacesAdded",
+                                         "oa{sa{sv}}", [path, {"org.bluez.Device1": props}]))
+
+    # --- EMPAREJAR Y CONECTAR ---
+
+    def _on_message(self, msg):
+        from dbus_next import MessageType
+
+        if msg.message_type != MessageType.METHOD_CALL:
+            return None
+        if msg.member == "RegisterAgent":
+            # El agente vive en la conexión del cliente: guardamos a quién llamar
+            self._agent_owner = msg.sender
+            return None
+        device = next((d for d in self.devices.values() if d.path == msg.path), None)
+        if device is None or msg.interface != "org.bluez.Device1" or msg.member not in ("Pair", "Connect"):
+            return None
+        step = self._pair if msg.member == "Pair" else self._connect
+        task = asyncio.ensure_future(step(msg, device))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+        return True
+
+    async def _pair(self, msg, device):
+        from dbus_next import Message, MessageType
+
+        if self._agent_owner is None:
+            self.bus.send(Message.new_error(msg, "org.bluez.Error.AuthenticationFailed", "Sin agente"))
+            return
+        # Como BlueZ, se pide confirmación al agente registrado
+        reply = await self.bus.call(Message(destination=self._agent_owner, path=self.agent_path,
+                                            interface="org.bluez.Agent1", member="RequestConfirmation",
+                                            signature="ou", body=[device.path, 123456]))
+        self.agent_calls.append(("RequestConfirmation", device.mac))
+        await asyncio.sleep(self.step_delay)
+        if reply.message_type == MessageType.ERROR or device.mac in self.REJECTS:
+            self.bus.send(Message.new_error(msg, "org.bluez.Error.AuthenticationRejected", "Emparejamiento rechazado"))
+            return
+        device.paired = True
+        device.emit_properties_changed({"Paired": True})
+        self.bus.send(Message.new_method_return(msg))
+
+    async def _connect(self, msg, device):
+        from dbus_next import Message
+
+        if not device.paired:
+            self.bus.send(Message.new_error(msg, "org.bluez.Error.Failed", "No emparejado"))
+            return
+        # Connect() responde antes de que el perfil de audio esté arriba
+        self.bus.send(Message.new_method_return(msg))
+        await asyncio.sleep(self.step_delay)
+        device.set_connected(True)
+
+
+async def choose_device(bt, wanted=None):
+    """
+    Lista los dispositivos en cuanto aparecen. Se puede escribir el número
+    sin esperar a que termine el escaneo. Con wanted (MAC o parte del
+    nombre) se elige solo el primero que coincida.
+    """
+    loop = asyncio.get_running_loop()
+    devices = []
+    chosen = loop.create_future()
 
-    return devices
+    def found(mac, name, rssi):
+        if not mac or any(mac == d[0] for d in devices):
+            return
+        devices.append((mac, name))
+        signal = f" [{rssi} dBm]" if rssi is not None else ""
+        print(f"{len(devices)}. {name} ({mac}){signal}")
+        if wanted and (wanted.upper() == mac.upper() or wanted.lower() in name.lower()) and not chosen.done():
+            chosen.set_result((mac, name))
+
+    print(f"\n🔍 Escaneando dispositivos (hasta {SCAN_TIME}s)...")
+    if not wanted:
+        print("👉 Escribe el número de tu dispositivo en cuanto aparezca y pulsa ENTER (0 para cancelar)\n")
+    await bt.start_discovery(found)
+
+    async def ask():
+        while True:
+            choice = await loop.run_in_executor(None, sys.stdin.readline)
+            try:
+                idx = int(choice) - 1
+            except ValueError:
+                print("Entrada no válida.")
+                continue
+            if idx == -1:
+                return None
+            if 0 <= idx < len(devices):
+                return devices[idx]
+            print("Número inválido.")
 
+    waiters = [chosen] if wanted else [chosen, asyncio.ensure_future(ask())]
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=SCAN_TIME, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            await bt.stop_discovery()
+            if wanted or not devices:
+                return None
+            print("⏹ Escaneo terminado.")
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        return done.pop().result()
+    finally:
+        await bt.stop_discovery()
 
-def pair_and_connect(mac, name):
-    print(f"\n🔗 Emparejando con {name} ({mac})...")
 
-    process = subprocess.Popen(
-        ["bluetoothctl"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True
+async def setup_device(bt, mac, name):
+    """Empareja, marca como de confianza y conecta, esperando a que cada paso termine"""
+    print(f"\n🔗 Configurando {name} ({mac})...")
+    steps = (
+        ("Emparejando", bt.pair),
+        ("Marcando como de confianza", bt.trust),
+        ("Conectando", bt.connect),
     )
+    for label, step in steps:
+        started = time.monotonic()
+        print(f"   - {label}...", end="", flush=True)
+        try:
+            await asyncio.wait_for(step(mac), STEP_TIMEOUT)
+        except Exception as e:
+            print(f" ❌ {str(e) or 'tiempo agotado'}")
+            return False
+        print(f" ✅ ({time.monotonic() - started:.1f}s)")
+    return True
+
+
+async def run(wanted=None, fake=False):
+    fake_bluez = FakeBluez() if fake else None
+    if fake_bluez:
+        await fake_bluez.start()
+    bt = Bluez(fake_bluez.address if fake_bluez else None)
+    try:
+        await bt.open()
+        try:
+            device = await choose_device(bt, wanted)
+            if device is None:
+                print("❌ No se ha elegido ningún dispositivo.")
+                return False
+            mac, name = device
+            if not await setup_device(bt, mac, name):
+                return False
+        finally:
+            await bt.close()
+    finally:
+        if fake_bluez:
+            await fake_bluez.stop()
+
+    print("\n✅ ¡Configuración terminada!")
+    print("El dispositivo ha sido marcado como 'Trusted'.")
+    print("La Raspberry Pi debería conectarse automáticamente a él al reiniciar.")
 
-    def send(cmd):
-        print(f"   > {cmd}")
-        process.stdin.write(cmd + "\n")
-        process.stdin.flush()
-        time.sleep(1)
+    # Guardar la MAC para forzar conexión si fuera necesario en el futuro
+    with open("bluetooth_mac.txt", "w") as f:
+        f.write(mac)
+    return True
 
-    send("power on")
-    send("agent on")
-    send("default-agent")
-    send("pairable on")
-    send(f"pair {mac}")
-    send(f"trust {mac}")
-    send(f"connect {mac}")
-    send("exit")
 
-    process.wait()
-    print("✅ Emparejado, trusted y conectado correctamente.")
+async def self_test():
+    """
+    Asistente contra FakeBluez sin teclado (--self-test): comprueba el
+    descubrimiento, el agente, el emparejamiento y la espera a Connected.
+    Devuelve True si todo es correcto.
+    """
+    fake = FakeBluez()
+    await fake.start()
+    checks = []
+
+    def check(name, passed, detail=""):
+        checks.append(passed)
+        print(f"{'✅' if passed else '❌'} {name}" + (f" ({detail})" if detail and not passed else ""))
+
+    try:
+        # 1. Descubrimiento por señales: solo los del adaptador elegido, en orden
+        bt = Bluez(fake.address)
+        await bt.open()
+        check("Agente NoInputNoOutput registrado",
+              (fake.agent_path, fake.capability) == (AGENT_PATH, "NoInputNoOutput"))
+        seen = []
+        await bt.start_discovery(lambda mac, name, rssi: seen.append(mac))
+        await asyncio.sleep(max(d[0] for d in fake.DEVICES) + 0.5)
+        await bt.stop_discovery()
+        await bt.close()
+        expected = [mac for _, adapter, mac, _, _ in fake.DEVICES if adapter == fake.ADAPTER]
+        check("Dispositivos descubiertos con InterfacesAdded", seen == expected, seen)
+
+        # 2. Un cliente nuevo ve los ya conocidos y configura los cascos
+        bt = Bluez(fake.address)
+        await bt.open()
+        device = await choose_device(bt, "cascos")
+        check("Dispositivo elegido con --device", device == ("11:22:33:44:55:02", "Cascos BT"), device)
+        started = time.monotonic()
+        ok = await setup_device(bt, "11:22:33:44:55:02", "Cascos BT")
+        cascos = fake.devices["11:22:33:44:55:02"]
+        check("Emparejado, de confianza y conectado", ok and cascos.paired and cascos.trusted and cascos.connected)
+        check("El agente confirma el emparejamiento", ("RequestConfirmation", cascos.mac) in fake.agent_calls)
+        # Pair() y la propiedad Connected tardan step_delay cada uno
+        check("Se espera a Connected tras Connect()", time.monotonic() - started >= 2 * fake.step_delay)
+
+        # 3. Un emparejamiento rechazado no sigue con los pasos siguientes
+        mac = FakeBluez.REJECTS[0]
+        ok = await setup_device(bt, mac, "Altavoz cocina")
+        check("Emparejamiento rechazado detectado", not ok and not fake.devices[mac].trusted)
+        await bt.close()
+    finally:
+        await fake.stop()
+
+    print(f"{'✅' if all(checks) else '❌'} {sum(checks)}/{len(checks)} comprobaciones correctas")
+    return all(checks)
+
 
 def install_autoconnect_service(mac):
     script_path = "/usr/local/bin/bt-autoconnect.sh"
@@ -146,75 +654,35 @@ WantedBy=multi-user.target
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Asistente de emparejamiento Bluetooth")
+    parser.add_argument("--device", help="MAC o parte del nombre: se elige en cuanto aparece")
+    parser.add_argument("--fake", action="store_true", help="BlueZ simulado en un bus D-Bus privado, para probar sin adaptador")
+    parser.add_argument("--self-test", action="store_true", help="Prueba automática contra el BlueZ simulado")
+    args = parser.parse_args()
+
+    if args.self_test:
+        sys.exit(0 if asyncio.run(self_test()) else 1)
+
+    # Asegurarse de correr como root/sudo para bluetooth
+    if not args.fake and os.geteuid() != 0:
+        print("⚠️  Por favor, ejecuta este script con sudo:")
+        print("   sudo venv/bin/python install/setup_bluetooth.py")
+        sys.exit(1)
+
     print("========================================")
     print("   ASISTENTE DE EMPAREJAMIENTO BT       ")
     print("========================================")
     print("1. Asegúrate de que tus cascos/altavoz están en MODO EMPAREJAMIENTO (parpadeando).")
-    input("👉 Pulsa ENTER cuando estén listos...")
-
-    print("\n🔍 Escaneando dispositivos (espera 10s)...")
-
-    # Iniciar escaneo en segundo plano
-    try:
-        subprocess.Popen(["bluetoothctl", "scan", "on"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        time.sleep(10)
-        # Obtener dispositivos
-        devices_raw = run_command("bluetoothctl devices")
-    finally:
-        # Parar escaneo para que no moleste
-        subprocess.run(["bluetoothctl", "scan", "off"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not args.device:
+        input("👉 Pulsa ENTER cuando estén listos...")
 
-    if not devices_raw:
-        print("❌ No se encontraron dispositivos. Inténtalo de nuevo.")
-        return
-
-    devices = []
-    print("\n🎧 Dispositivos encontrados:")
-    lines = devices_raw.split('\n')
-    for i, line in enumerate(lines):
-        # Formato: Device XX:XX:XX:XX:XX:XX Name
-        parts = line.split(' ', 2)
-        if len(parts) >= 3:
-            mac = parts[1]
-            name = parts[2]
-            devices.append((mac, name))
-            print(f"{i + 1}. {name} ({mac})")
-
-    choice = input("\n👉 Selecciona el número de tu dispositivo: ")
     try:
-        idx = int(choice) - 1
-        if idx < 0 or idx >= len(devices):
-            print("Número inválido.")
-            return
-
-        target_mac, target_name = devices[idx]
-        print(f"\n🔗 Intentando emparejar con {target_name}...")
-
-        # Secuencia de comandos bluetoothctl
-        print(f"   - Trusting {target_mac}...")
-        run_command(f"bluetoothctl trust {target_mac}")
-
-        print(f"   - Pairing {target_mac}...")
-        pair_res = run_command(f"bluetoothctl pair {target_mac}")
-
-        print(f"   - Connecting {target_mac}...")
-        connect_res = run_command(f"bluetoothctl connect {target_mac}")
-
-        print("\n✅ ¡Configuración terminada!")
-        print("El dispositivo ha sido marcado como 'Trusted'.")
-        print("La Raspberry Pi debería conectarse automáticamente a él al reiniciar.")
-
-        # Guardar la MAC para forzar conexión si fuera necesario en el futuro
-        with open("bluetooth_mac.txt", "w") as f:
-            f.write(target_mac)
-
-    except ValueError:
-        print("Entrada no válida.")
+        ok = asyncio.run(run(args.device, args.fake))
+    except KeyboardInterrupt:
+        ok = False
+    # os._exit: el hilo que espera la entrada por teclado no se puede cancelar
+    sys.stdout.flush()
+    os._exit(0 if ok else 1)
 
 if __name__ == "__main__":
-    # Asegurarse de correr como root/sudo para bluetooth
-    if os.geteuid() != 0:
-        print("⚠️  Por favor, ejecuta este script con sudo:")
-        print("   sudo python3 install/setup_bluetooth.py")
-        sys.exit(1)
     main()
@@ -2,13 +2,8 @@ import sys
 import json
 import time
 import os
-import libsonic
-import subprocess
-import atexit
-import signal
 from dotenv import load_dotenv
 from pathlib import Path
-from mfrc522 import SimpleMFRC522
 
 
 # --- GESTIÓN DE RUTAS (PATHS) ---
@@ -16,6 +11,13 @@ from mfrc522 import SimpleMFRC522
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 # Obtenemos la ruta padre (carpeta raíz del proyecto)
 ROOT_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
+sys.path.insert(0, ROOT_DIR)
+
+# El lector se comparte con el reproductor a través del broker RFID,
+# así que ya no hace falta parar el servicio recordplayer
+from rfid_broker import create_reader
+from server_pool import ServerPool
+from control_api import send_command
 
 # Archivos de configuración
 ENV_FILE = os.path.join(ROOT_DIR, ".env")
@@ -24,39 +26,25 @@ RFID_FILE = os.path.join(ROOT_DIR, "rfid.json")
 # Cargar credenciales
 load_dotenv(ENV_FILE)
 
-SERVER = os.getenv("SUBSONIC_URL")
+# Admite varios servidores separados por comas, como el reproductor
+SERVERS = [url.strip() for url in os.getenv("SUBSONIC_URL", "").split(",") if url.strip()]
 PORT = os.getenv("SUBSONIC_PORT")
 USER = os.getenv("SUBSONIC_USER")
 PASS = os.getenv("SUBSONIC_PASS")
 
-SERVICE_NAME = "recordplayer"
-
-def stop_recordplayer():
-    print(f"⏹ Parando servicio {SERVICE_NAME}...")
-    subprocess.run(
-        ["sudo", "systemctl", "stop", SERVICE_NAME],
-        check=False
-    )
-
-def start_recordplayer():
-    print(f"▶ Arrancando servicio  {SERVICE_NAME}...")
-    subprocess.run(
-        ["sudo", "systemctl", "start", SERVICE_NAME],
-        check=False
-    )
-
 def connect_subsonic():
-    """Establece conexión con el servidor Subsonic"""
-    if not all([SERVER, USER, PASS]):
+    """Establece conexión con los servidores Subsonic (con failover entre ellos)"""
+    if not all([SERVERS, USER, PASS]):
         print("❌ Error: Faltan datos en el archivo .env")
         sys.exit(1)
 
     try:
-        conn = libsonic.Connection(SERVER, USER, PASS, port= PORT, appName="JukePi")
-        if not conn.ping():
+        pool = ServerPool(SERVERS, PORT, USER, PASS)
+        pool.health_check()
+        if all(ep.failures for ep in pool.endpoints):
             print("❌ No se pudo conectar a Subsonic. Verifica tu .env")
             sys.exit(1)
-        return conn
+        return pool
     except Exception as e:
         print(f"❌ Error de conexión: {e}")
         sys.exit(1)
@@ -78,13 +66,22 @@ def write_rfid_file(rfid_map):
     with open(RFID_FILE, "w") as json_file:
         json.dump(rfid_map, json_file, indent=4)
     print("✅ Guardado correctamente en rfid.json")
+    notify_player()
+
+def notify_player():
+    """Pide al reproductor en marcha que recargue rfid.json (si no está, no pasa nada)"""
+    try:
+        send_command("reload", timeout=5)
+        print("🔁 Reproductor avisado: la etiqueta ya funciona")
+    except (OSError, ValueError):
+        pass
 
 def search_and_select(conn, search_type):
     """Buscador interactivo de Subsonic"""
     if search_type == "playlist":
         # Las playlists se listan directamente, no se buscan por texto
         print("\n📥 Obteniendo playlists...")
-        playlists = conn.getPlaylists().get('playlists', {}).get('playlist', [])
+        playlists = conn.call("getPlaylists").get('playlists', {}).get('playlist', [])
 
         if not playlists:
             print("❌ No tienes playlists creadas en Subsonic.")
@@ -104,7 +101,7 @@ def search_and_select(conn, search_type):
             print("Buscando...")
 
             # Subsonic API search3 devuelve resultados anidados
-            results = conn.search3(query)
+            results = conn.call("search3", query)
             items = []
 
             if search_type == "album" and 'album' in results.get('searchResult3', {}):
@@ -143,8 +140,7 @@ def select_item(items, type_label):
         except ValueError:
             print("❌ Por favor introduce un número.")
 
-def write_rfid_tags(conn):
-    rfid = SimpleMFRC522()
+def write_rfid_tags(conn, rfid):
     rfid_map = read_rfid_file()
 
     while True:
@@ -202,8 +198,7 @@ def write_rfid_tags(conn):
         if continuar != 's':
             break
 
-def read_rfid_mode():
-    rfid = SimpleMFRC522()
+def read_rfid_mode(rfid):
     rfid_map = read_rfid_file()
 
     print("\n--- MODO LECTURA (Ctrl+C para salir) ---")
@@ -220,12 +215,10 @@ def read_rfid_mode():
     except KeyboardInterrupt:
         return
 
-def cleanup_and_exit(signum=None, frame=None):
-    start_recordplayer()
-    sys.exit(0)
-
 def main():
     conn = connect_subsonic()
+    # Broker si está en marcha; si no, el RC522 directamente
+    rfid = create_reader(fallback=True)
 
     while True:
         print("\n=== MENÚ PRINCIPAL ===")
@@ -236,9 +229,9 @@ def main():
         choice = input("Elige una opción: ")
 
         if choice == "1":
-            write_rfid_tags(conn)
+            write_rfid_tags(conn, rfid)
         elif choice == "2":
-            read_rfid_mode()
+            read_rfid_mode(rfid)
         elif choice == "3":
             print("Adiós 👋")
             break
@@ -246,14 +239,7 @@ def main():
             print("Opción inválida")
 
 if __name__ == "__main__":
-        # Parar el servicio al iniciar el script
-    stop_recordplayer()
-
-    # Reanudar el servicio SIEMPRE al salir
-    atexit.register(start_recordplayer)
-
-    # Capturar Ctrl+C y señales de kill
-    signal.signal(signal.SIGINT, cleanup_and_exit)
-    signal.signal(signal.SIGTERM, cleanup_and_exit)
-
-    main()
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nAdiós 👋")
@@ -0,0 +1,144 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+PLAY_HISTORY_FILE = os.getenv("PLAY_HISTORY_FILE", "history.jsonl")
+# Reproducciones que se conservan (las más antiguas se descartan al compactar)
+HISTORY_MAX = int(os.getenv("HISTORY_MAX", 2000))
+# Vida media del peso de una reproducción (días)
+HISTORY_HALF_LIFE_DAYS = float(os.getenv("HISTORY_HALF_LIFE_DAYS", 14))
+# Una reproducción más corta no cuenta (etiqueta puesta por error)
+HISTORY_MIN_SECONDS = 20
+# Minutos de escucha a partir de los que una reproducción pesa lo máximo
+HISTORY_FULL_LISTEN = 10 * 60
+# Peso extra de los discos que suelen ir detrás del actual
+TRANSITION_WEIGHT = 2.0
+# Dos discos seguidos separados más de esto no cuentan como transición
+TRANSITION_GAP = 6 * 3600
+
+
+class PlayHistory:
+    """
+    Historial local de discos puestos: etiqueta, URI, instante (de donde sale
+    la hora del día) y segundos escuchados. Se guarda como JSON por líneas,
+    solo añadiendo al final; al cargar se compacta si ha crecido demasiado.
+    """
+
+    def __init__(self, path=PLAY_HISTORY_FILE, max_entries=HISTORY_MAX):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = deque(maxlen=max_entries)   # (ts, tag, uri, segundos)
+        self._lock = threading.Lock()
+        self._session = None                       # [tag, uri, inicio, escuchado, reanudado en]
+        self._load()
+
+    # --- SESIÓN ACTUAL ---
+
+    def start(self, tag, uri):
+        now = time.monotonic()
+        with self._lock:
+            self._finish(now)
+            self._session = [tag, uri, time.time(), 0.0, now]
+
+    def pause(self):
+        with self._lock:
+            if self._session and self._session[4] is not None:
+                self._session[3] += time.monotonic() - self._session[4]
+                self._session[4] = None
+
+    def resume(self):
+        with self._lock:
+            if self._session and self._session[4] is None:
+                self._session[4] = time.monotonic()
+
+    def finish(self):
+        with self._lock:
+            self._finish(time.monotonic())
+
+    def _finish(self, now):
+        if not self._session:
+            return
+        tag, uri, started, listened, resumed = self._session
+        self._session = None
+        if resumed is not None:
+            listened += now - resumed
+        if listened < HISTORY_MIN_SECONDS:
+            return
+        entry = (int(started), tag, uri, int(listened))
+        self.entries.append(entry)
+        try:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            log.warning(event_log.SYSTEM, f"⚠️ No se pudo guardar el historial: {e}")
+
+    # --- PERSISTENCIA ---
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        self.entries.append(tuple(json.loads(line)))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            return
+        # Compactamos solo de vez en cuando para no reescribir la SD en cada arranque
+        if lines > 2 * self.max_entries:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in self.entries)
+            os.replace(tmp_path, self.path)
+
+    # --- PREDICCIÓN ---
+
+    def rank(self, current_uri=None, now=None, limit=None):
+        """
+        Discos ordenados por probabilidad de ser los siguientes.
+
+        Cada reproducción suma un peso que decae con su antigüedad, crece con
+        lo que se escuchó y es mayor cuanto más se parece su hora del día a
+        la actual. Los discos que suelen ir detrás de current_uri reciben un
+        extra. Devuelve [(uri, puntuación)] sin incluir current_uri.
+        """
+        now = now or time.time()
+        hour = time.localtime(now).tm_hour + time.localtime(now).tm_min / 60
+        decay = math.log(2) / (HISTORY_HALF_LIFE_DAYS * 86400)
+        scores = Counter()
+        following = Counter()
+        previous = None
+
+        with self._lock:
+            entries = list(self.entries)
+
+        for ts, _tag, uri, seconds in entries:
+            local = time.localtime(ts)
+            delta = hour - (local.tm_hour + local.tm_min / 60)
+            # 1 a la misma hora, 0.2 a doce horas de distancia
+            time_of_day = 0.6 + 0.4 * math.cos(2 * math.pi * delta / 24)
+            listen = min(seconds / HISTORY_FULL_LISTEN, 1.0)
+            scores[uri] += math.exp(-decay * max(now - ts, 0)) * time_of_day * listen
+
+            if previous and previous[1] == current_uri and ts - previous[0] <= TRANSITION_GAP:
+                following[uri] += 1
+            previous = (ts, uri)
+
+        total = sum(following.values())
+        for uri, count in following.items():
+            scores[uri] += TRANSITION_WEIGHT * count / total
+
+        scores.pop(current_uri, None)
+        return scores.most_common(limit)
+
+    def status(self):
+        return {"entries": len(self.entries)}
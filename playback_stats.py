@@ -0,0 +1,161 @@
+import threading
+import time
+
+import event_log
+from event_log import log
+
+# Pistas con más tiempo atascado que se guardan para el informe
+WORST_TRACKS = 10
+
+
+class TrackRecord:
+    """Telemetría de una pista mientras suena"""
+    __slots__ = ("track", "uri", "group", "started", "startup_ms", "stalls",
+                 "stalled", "stall_started", "buffering")
+
+    def __init__(self, track, uri, group, started):
+        self.track = track
+        self.uri = uri
+        self.group = group
+        self.started = started
+        self.startup_ms = None      # hasta el primer buffer al 100%
+        self.stalls = 0
+        self.stalled = 0.0          # segundos sin audio tras haber empezado
+        self.stall_started = None
+        self.buffering = None       # último porcentaje de buffer
+
+
+class PlaybackStats:
+    """
+    Telemetría de reproducción: eventos de buffering del backend y
+    estadísticas de la media (bytes leídos, bitrate de entrada y demux,
+    buffers perdidos) agregadas por servidor, formato y bitrate.
+
+    Un vaciado del buffer después de haber empezado a sonar cuenta como
+    atasco (underrun); el buffering inicial se mide aparte como arranque.
+    Los callbacks llegan desde el hilo del backend y solo actualizan
+    contadores bajo un lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = None
+        self.groups = {}
+        self.records = {}
+        self.worst = []
+
+    @staticmethod
+    def group_key(server, track):
+        fmt = getattr(track, "suffix", None) or "?"
+        bitrate = getattr(track, "bitrate", 0) or 0
+        return f"{server or '?'} {fmt} {bitrate}k"
+
+    # --- EVENTOS DEL BACKEND ---
+
+    def track_started(self, track, server, uri):
+        now = time.monotonic()
+        with self._lock:
+            if self.current is not None:
+                # El backend no mandó estadísticas de la anterior: la cerramos sin ellas
+                self._close_stall(now)
+                self._add(self.current, {}, now)
+            self.current = TrackRecord(track, uri, self.group_key(server, track), now)
+
+    def buffering(self, percent):
+        now = time.monotonic()
+        with self._lock:
+            record = self.current
+            if record is None:
+                return
+            record.buffering = percent
+            if percent >= 100:
+                if record.startup_ms is None:
+                    record.startup_ms = round((now - record.started) * 1000)
+                self._close_stall(now)
+            elif record.startup_ms is not None and record.stall_started is None:
+                record.stall_started = now
+                record.stalls += 1
+                log.warning(event_log.PLAYBACK, f"🐢 Buffer vacío en {record.track.title}",
+                            group=record.group, percent=round(percent))
+
+    def track_finished(self, stats):
+        """Estadísticas finales de la media (las emite el backend con 'track_stats')"""
+        now = time.monotonic()
+        with self._lock:
+            record, self.current = self.current, None
+            if record is None:
+                return
+            self._close_stall(now, record)
+            self._add(record, stats or {}, now)
+
+    def _close_stall(self, now, record=None):
+        record = record or self.current
+        if record is not None and record.stall_started is not None:
+            record.stalled += now - record.stall_started
+            record.stall_started = None
+
+    def _add(self, record, stats, now):
+        group = self.groups.setdefault(record.group, {
+            "tracks": 0, "seconds": 0.0, "bytes_read": 0, "input_kbps": 0.0, "demux_kbps": 0.0, "rated": 0,
+            "lost_buffers": 0, "stalls": 0, "stalled_s": 0.0, "startup_ms": 0, "startups": 0,
+        })
+        group["tracks"] += 1
+        group["seconds"] += now - record.started
+        group["bytes_read"] += stats.get("bytes_read") or 0
+        group["lost_buffers"] += stats.get("lost_buffers") or 0
+        group["stalls"] += record.stalls
+        group["stalled_s"] += record.stalled
+        if record.startup_ms is not None:
+            group["startup_ms"] += record.startup_ms
+            group["startups"] += 1
+        # Media por pista de los bitrates (cada uno ya es una media del backend)
+        if stats.get("input_kbps") is not None or stats.get("demux_kbps") is not None:
+            group["rated"] += 1
+            for key in ("input_kbps", "demux_kbps"):
+                group[key] += ((stats.get(key) or 0) - group[key]) / group["rated"]
+
+        if record.uri:
+            disc = self.records.setdefault(record.uri, {"tracks": 0, "stalls": 0, "stalled_s": 0.0})
+            disc["tracks"] += 1
+            disc["stalls"] += record.stalls
+            disc["stalled_s"] += record.stalled
+
+        if record.stalled > 0:
+            self.worst.append((round(record.stalled, 1), record.track.title, record.uri, record.group))
+            self.worst.sort(reverse=True)
+            del self.worst[WORST_TRACKS:]
+
+    # --- INFORME ---
+
+    def status(self):
+        with self._lock:
+            current = self.current
+            groups = {}
+            for key, g in self.groups.items():
+                groups[key] = {
+                    "tracks": g["tracks"],
+                    "mb_read": round(g["bytes_read"] / 1_000_000, 1),
+                    "input_kbps": round(g["input_kbps"]),
+                    "demux_kbps": round(g["demux_kbps"]),
+                    "lost_buffers": g["lost_buffers"],
+                    "stalls": g["stalls"],
+                    "stalled_s": round(g["stalled_s"], 1),
+                    # Fracción del tiempo de escucha sin audio
+                    "stalled_pct": round(100 * g["stalled_s"] / g["seconds"], 2) if g["seconds"] else 0,
+                    "avg_startup_ms": round(g["startup_ms"] / g["startups"]) if g["startups"] else None,
+                }
+            stuttering = sorted(
+                ((uri, r) for uri, r in self.records.items() if r["stalls"]),
+                key=lambda item: item[1]["stalled_s"], reverse=True)
+            return {
+                "current": {
+                    "title": current.track.title,
+                    "group": current.group,
+                    "buffering": current.buffering,
+                    "startup_ms": current.startup_ms,
+                    "stalls": current.stalls,
+                } if current else None,
+                "groups": groups,
+                "records": {uri: dict(r, stalled_s=round(r["stalled_s"], 1)) for uri, r in stuttering[:WORST_TRACKS]},
+                "worst_tracks": list(self.worst),
+            }
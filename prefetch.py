@@ -0,0 +1,274 @@
+import os
+import random
+import threading
+import time
+import urllib.request
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+# Discos más probables que se mantienen preparados (0 = desactivado)
+PREFETCH_TOP_K = int(os.getenv("PREFETCH_TOP_K", 3))
+# Pistas del principio de cada disco que se descargan a disco
+PREFETCH_TRACKS = int(os.getenv("PREFETCH_TRACKS", 1))
+PREFETCH_DIR = os.getenv("PREFETCH_DIR", "cache")
+# Espacio máximo de las pistas descargadas (MB)
+PREFETCH_DISK_BUDGET_MB = float(os.getenv("PREFETCH_DISK_BUDGET_MB", 300))
+# Cada cuánto se recalcula la predicción (además de tras cada disco nuevo)
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", 600))
+# Validez de una lista de pistas ya resuelta (segundos)
+PREFETCH_TRACKLIST_TTL = float(os.getenv("PREFETCH_TRACKLIST_TTL", 3600))
+# Tras un disco nuevo, la precarga espera a que su buffer se llene (o este
+# máximo de segundos si el backend no avisa) para no competir por la red
+PREFETCH_START_DELAY = float(os.getenv("PREFETCH_START_DELAY", 10))
+PREFETCH_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+# Discos que se barajan en cada reproducción (subsonic:artist:id)
+SHUFFLED_TYPES = ("artist",)
+# Sin Content-Length (streams transcodificados) el espacio se reserva por tramos
+RESERVE_STEP = 1024 * 1024
+
+
+def _shuffled(uri):
+    parts = uri.split(":")
+    return len(parts) == 3 and parts[1] in SHUFFLED_TYPES
+
+
+class Prefetcher:
+    """
+    Mantiene preparados los discos que el historial predice como siguientes:
+    lista de pistas ya resuelta en memoria y primeras pistas descargadas en
+    PREFETCH_DIR, dentro de PREFETCH_DISK_BUDGET_MB. Al poner uno de esos
+    discos la cola se carga sin esperar al servidor y la primera pista suena
+    desde la tarjeta SD mientras el resto llega por streaming.
+
+    Trabaja en su propio hilo y se suspende en reposo, como los pings del
+    ServerPool.
+    """
+
+    def __init__(self, history, fetch, stream_url, top_k=PREFETCH_TOP_K, tracks=PREFETCH_TRACKS,
+                 directory=PREFETCH_DIR, budget_mb=PREFETCH_DISK_BUDGET_MB, interval=PREFETCH_INTERVAL):
+        self.history = history
+        self.fetch = fetch              # uri -> [Track]
+        self.stream_url = stream_url    # Track -> URL remota
+        self.top_k = top_k
+        self.tracks = tracks
+        self.directory = directory
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.interval = interval
+
+        self.current_uri = None
+        self.top = []
+        self._tracklists = {}           # uri -> (instante, [Track])
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._suspended = threading.Event()
+        self._thread = None
+        self._downloading = None        # .part en curso (se cuenta aparte)
+        self._deferred = None           # instante límite para esperar al buffer del disco nuevo
+        # Pistas completas en disco: local_url() no toca la SD en el camino rápido
+        self._cached = {path for _, _, path in self._files() if not path.endswith(".part")}
+        self.hits = 0
+        self.misses = 0
+        self.file_hits = 0
+
+    # --- CONSULTAS DEL REPRODUCTOR (camino rápido) ---
+
+    def tracklist(self, uri):
+        """Lista de pistas preparada para uri, o None (cuenta acierto/fallo)"""
+        with self._lock:
+            cached = self._tracklists.get(uri)
+        if cached and time.monotonic() - cached[0] < PREFETCH_TRACKLIST_TTL:
+            self.hits += 1
+            tracks = list(cached[1])
+            # Un artista suena en orden aleatorio cada vez, como sin caché
+            if _shuffled(uri):
+                random.shuffle(tracks)
+            return tracks
+        self.misses += 1
+        return None
+
+    def _path(self, track):
+        return os.path.join(self.directory, f"{track.id}.{track.suffix or 'audio'}")
+
+    def local_url(self, track):
+        """URL file:// de la pista si está descargada completa"""
+        path = self._path(track)
+        if path not in self._cached:
+            return None
+        os.utime(path)
+        self.file_hits += 1
+        return "file://" + os.path.abspath(path)
+
+    def played(self, uri):
+        """
+        Un disco nuevo cambia la predicción: recalculamos en segundo plano en
+        cuanto su buffer esté lleno (buffered()). La descarga en curso se corta.
+        """
+        self.current_uri = uri
+        self._deferred = time.monotonic() + PREFETCH_START_DELAY
+        self._wake.set()
+
+    def buffered(self):
+        """El disco que suena ya tiene buffer: la red queda libre para precargar"""
+        if self._deferred is not None:
+            self._deferred = None
+            self._wake.set()
+
+    # --- TRABAJO EN SEGUNDO PLANO ---
+
+    def refresh(self):
+        self.top = [uri for uri, _ in self.history.rank(self.current_uri, limit=self.top_k)]
+        if self.top:
+            log.debug(event_log.FETCH, "🔮 Discos previstos", top=self.top)
+
+        wanted = set()
+        for uri in self.top:
+            if self._stop.is_set() or self._suspended.is_set() or self._deferred is not None:
+                return
+            tracks = self._resolve(uri)
+            # Con orden aleatorio no se sabe cuál sonará primero: solo la lista
+            for track in ([] if _shuffled(uri) else tracks[:self.tracks]):
+                wanted.add(self._path(track))
+                self._download(track, wanted)
+        self._evict(wanted)
+
+    def _resolve(self, uri):
+        with self._lock:
+            cached = self._tracklists.get(uri)
+        if cached and time.monotonic() - cached[0] < PREFETCH_TRACKLIST_TTL:
+            return cached[1]
+        tracks = self.fetch(uri)
+        if tracks:
+            with self._lock:
+                self._tracklists[uri] = (time.monotonic(), tracks)
+                # Solo guardamos las listas de los discos previstos
+                for old in [u for u in self._tracklists if u not in self.top]:
+                    del self._tracklists[old]
+        return tracks
+
+    def _download(self, track, wanted):
+        path = self._path(track)
+        if path in self._cached:
+            os.utime(path)  # más reciente = último en desalojarse
+            return
+        tmp_path = path + ".part"
+        self._downloading = tmp_path
+        try:
+            with urllib.request.urlopen(self.stream_url(track), timeout=PREFETCH_TIMEOUT) as response:
+                # Espacio reservado: lo anunciado, o se va ampliando si no se sabe
+                reserved = int(response.headers.get("Content-Length") or 0)
+                if not self._make_room(reserved, wanted):
+                    log.debug(event_log.FETCH, f"💾 Sin espacio para precargar {track.title}", bytes=reserved)
+                    return
+                os.makedirs(self.directory, exist_ok=True)
+                written = 0
+                complete = False
+                with open(tmp_path, "wb") as f:
+                    while not self._stop.is_set() and self._deferred is None:
+                        chunk = response.read(CHUNK_SIZE)
+                        if not chunk:
+                            complete = True
+                            break
+                        written += len(chunk)
+                        if written > reserved:
+                            reserved = written + RESERVE_STEP
+                            if not self._make_room(reserved, wanted):
+                                log.debug(event_log.FETCH, f"💾 Sin espacio para precargar {track.title}",
+                                          bytes=written)
+                                break
+                        f.write(chunk)
+            if not complete:
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+            self._cached.add(path)
+            log.info(event_log.FETCH, f"💾 Precargada: {track.title}")
+        except Exception as e:
+            log.warning(event_log.FETCH, f"⚠️ Precarga fallida de {track.title}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            self._downloading = None
+
+    def _files(self):
+        """[(mtime, tamaño, ruta)] de las pistas descargadas (sin la que está en curso), la menos usada primero"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if path == self._downloading:
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files)
+
+    def _make_room(self, size, wanted):
+        """Desaloja pistas no previstas hasta que quepan size bytes"""
+        files = self._files()
+        used = sum(f[1] for f in files)
+        for _, file_size, path in files:
+            if used + size <= self.budget:
+                break
+            if path not in wanted:
+                self._cached.discard(path)
+                os.remove(path)
+                used -= file_size
+        return used + size <= self.budget
+
+    def _evict(self, wanted):
+        """Dentro del presupuesto se conservan también pistas de otros discos"""
+        self._make_room(0, wanted)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Disco recién puesto: esperamos a buffered() o a PREFETCH_START_DELAY
+            deferred = self._deferred
+            if deferred is not None:
+                if time.monotonic() < deferred:
+                    self._wake.wait(deferred - time.monotonic())
+                    self._wake.clear()
+                    continue
+                self._deferred = None
+            if not self._suspended.is_set():
+                try:
+                    self.refresh()
+                except Exception as e:
+                    log.warning(event_log.FETCH, f"⚠️ Error en la precarga: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        if not self.top_k:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="prefetch")
+        self._thread.start()
+
+    def suspend(self):
+        """Sin descargas en reposo"""
+        self._suspended.set()
+
+    def resume(self):
+        self._suspended.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def status(self):
+        files = self._files()
+        return {
+            "top": list(self.top),
+            "tracklists": len(self._tracklists),
+            "files": len(files),
+            "disk_mb": round(sum(f[1] for f in files) / 1024 / 1024, 1),
+            "budget_mb": round(self.budget / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "file_hits": self.file_hits,
+        }
@@ -0,0 +1,167 @@
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+# PROFILE=1 activa el perfilado del bucle de control y del motor
+PROFILE = os.getenv("PROFILE") == "1"
+# Presupuesto por tick de RecordPlayer.update() (segundos)
+PROFILE_TICK_BUDGET = float(os.getenv("PROFILE_TICK_BUDGET", 0.05))
+# Intervalo de muestreo de pilas para el flame graph
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.01))
+# Prefijo de los ficheros generados con SIGUSR2 (.folded y .txt)
+PROFILE_OUTPUT = os.getenv("PROFILE_OUTPUT", "profile")
+
+
+class Histogram:
+    """Histograma en cubos de potencias de dos de microsegundos"""
+
+    def __init__(self):
+        self.buckets = [0] * 32
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = int(seconds * 1_000_000)
+        self.buckets[min(max(micros, 0).bit_length(), 31)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """Cota superior (en segundos) del cubo donde cae el percentil"""
+        target = self.count * fraction
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return (1 << bucket) / 1_000_000
+        return 0.0
+
+    def summary(self):
+        if not self.count:
+            return "sin muestras"
+        return (f"n={self.count} media={self.total / self.count * 1000:.3f}ms "
+                f"p50<={self.percentile(0.5) * 1000:.3f}ms p99<={self.percentile(0.99) * 1000:.3f}ms "
+                f"max={self.max * 1000:.3f}ms")
+
+    def lines(self):
+        for bucket, n in enumerate(self.buckets):
+            if n:
+                yield f"  <= {(1 << bucket) / 1000:>10.3f} ms: {n}"
+
+
+class TickProfiler:
+    """
+    Perfilado opcional del bucle de control.
+
+    - Duración de cada tick de RecordPlayer.update() en un histograma.
+    - Retraso del hilo del motor respecto a STEP_DELAY en cada paso.
+    - Un hilo vigilante muestrea las pilas de todos los hilos (formato
+      "folded" compatible con flamegraph.pl / speedscope) y, si un tick
+      supera su presupuesto, guarda la pila del hilo que lo está bloqueando.
+    """
+
+    def __init__(self, budget=PROFILE_TICK_BUDGET, sample_interval=PROFILE_SAMPLE_INTERVAL):
+        self.budget = budget
+        self.sample_interval = sample_interval
+        self.ticks = Histogram()
+        self.steps = Histogram()
+        self.folded = Counter()
+        self.overruns = deque(maxlen=20)
+        self._tick_started = None
+        self._tick_thread = None
+        self._blocked_stack = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- MEDIDAS (camino rápido) ---
+
+    def tick_start(self):
+        self._blocked_stack = None
+        self._tick_thread = threading.get_ident()
+        self._tick_started = time.perf_counter()
+
+    def tick_end(self):
+        elapsed = time.perf_counter() - self._tick_started
+        self._tick_started = None
+        self.ticks.add(elapsed)
+        if elapsed > self.budget:
+            stack = self._blocked_stack or []
+            self.overruns.append((time.time(), elapsed, stack))
+            where = stack[-1].strip().splitlines()[0] if stack else "?"
+            log.warning(event_log.SYSTEM, f"🐢 Tick de {elapsed * 1000:.0f} ms (presupuesto {self.budget * 1000:.0f} ms)",
+                        at=where)
+
+    def step_lateness(self, seconds):
+        self.steps.add(seconds)
+
+    # --- VIGILANTE / MUESTREO ---
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        frames = sys._current_frames()
+        for ident, frame in frames.items():
+            if ident == threading.get_ident():
+                continue
+            stack = traceback.extract_stack(frame)
+            key = ";".join([names.get(ident, str(ident))] + [f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})" for f in stack])
+            self.folded[key] += 1
+
+        started = self._tick_started
+        if (started is not None and self._blocked_stack is None
+                and time.perf_counter() - started > self.budget):
+            frame = frames.get(self._tick_thread)
+            if frame is not None:
+                self._blocked_stack = traceback.format_stack(frame)
+
+    def _run(self):
+        while not self._stop.wait(self.sample_interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.dump())
+        log.info(event_log.SYSTEM, f"📊 Perfilado activo (SIGUSR2 -> {PROFILE_OUTPUT}.folded)")
+
+    def stop(self):
+        self._stop.set()
+
+    # --- VOLCADO ---
+
+    def dump(self, prefix=PROFILE_OUTPUT):
+        with open(f"{prefix}.folded", "w") as f:
+            for stack, count in self.folded.items():
+                f.write(f"{stack} {count}\n")
+
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(f"Ticks de update(): {self.ticks.summary()}\n")
+            f.writelines(line + "\n" for line in self.ticks.lines())
+            f.write(f"\nRetraso de pasos del motor: {self.steps.summary()}\n")
+            f.writelines(line + "\n" for line in self.steps.lines())
+            f.write(f"\nTicks fuera de presupuesto (últimos {len(self.overruns)}):\n")
+            for ts, elapsed, stack in self.overruns:
+                stamp = time.strftime("%H:%M:%S", time.localtime(ts))
+                f.write(f"\n[{stamp}] {elapsed * 1000:.1f} ms\n")
+                f.writelines(stack)
+
+        log.info(event_log.SYSTEM, f"📊 Perfil volcado en {prefix}.folded / {prefix}.txt")
+
+
+def create_profiler():
+    """TickProfiler si PROFILE=1; None en caso contrario (coste cero)"""
+    if not PROFILE:
+        return None
+    profiler = TickProfiler()
+    profiler.start()
+    return profiler
@@ -4,21 +4,55 @@ import RPi.GPIO as GPIO
 import threading
 import sys
 import time
-import libsonic
-import vlc
+import math
 import hashlib
+import signal
 import string
 import random
 from urllib.parse import quote
 from dotenv import load_dotenv
 from gpiozero import DigitalInputDevice, DigitalOutputDevice
 from gpiozero.pins.lgpio import LGPIOFactory
-from mfrc522 import SimpleMFRC522
+import event_log
+from event_log import log
+from control_api import ControlServer
+from audio_backends import create_backend
+from server_pool import ServerPool
+from scrobbler import Scrobbler
+from profiler import create_profiler
+from tracks import Track
+from playback_stats import PlaybackStats
+from play_history import PlayHistory
+from prefetch import Prefetcher
+from clock import REAL_CLOCK, VirtualClock
+from rfid_broker import create_reader
 
 # --- CONFIGURACIÓN DE HARDWARE ---
 HALL_SENSOR_PIN = 17
 STEPPER_PINS = [14, 15, 18, 23]
 
+# --- MODO REPOSO ---
+# Segundos con el brazo levantado antes de liberar recursos (0 = nunca)
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", 300))
+
+# --- CAMBIO DE DISCO ---
+# Prepara el disco nuevo en un segundo reproductor mientras suena el anterior
+DOUBLE_BUFFER = os.getenv("DOUBLE_BUFFER", "1") == "1"
+# Segundos máximos esperando a que el disco nuevo llene el buffer
+SWAP_TIMEOUT = float(os.getenv("SWAP_TIMEOUT", 8))
+# Fundido entre discos (0 = corte seco en cuanto el nuevo está listo)
+CROSSFADE_MS = int(os.getenv("CROSSFADE_MS", 0))
+
+# --- FILTRO DEL SENSOR HALL ---
+# Tiempo que la lectura filtrada debe mantenerse antes de aceptar el cambio
+HALL_ENGAGE_SETTLE = float(os.getenv("HALL_ENGAGE_SETTLE", 0.1))
+HALL_RELEASE_SETTLE = float(os.getenv("HALL_RELEASE_SETTLE", 0.3))
+# Umbrales de histéresis sobre la media (0..1) de las lecturas
+HALL_ENGAGE_THRESHOLD = float(os.getenv("HALL_ENGAGE_THRESHOLD", 0.7))
+HALL_RELEASE_THRESHOLD = float(os.getenv("HALL_RELEASE_THRESHOLD", 0.3))
+# Constante de tiempo de la media ponderada (segundos)
+HALL_TIME_CONSTANT = 0.05
+
 # --- GESTIÓN DE RUTAS ---
 ENV_FILE = ".env"
 RFID_FILE = "rfid.json"
@@ -27,50 +61,125 @@ class SubsonicController:
     def __init__(self):
         self.load_config()
         self.init_subsonic()
-        self.init_vlc()
+        self.init_audio()
         self.rfid_map = self.load_rfid_map()
         self.current_uri = None
+        self.songs = []
+        self.saved_state = None  # (índice, milisegundos) tras release()
+        # La API de control y el bucle principal llaman a los mismos métodos
+        # desde hilos distintos: los que tocan la cola o el backend van en serie
+        self._lock = threading.RLock()
+        # Contadores de latencia (los lee la API de control)
+        self.stats = {"fetches": 0, "fetch_errors": 0, "last_fetch_ms": None, "last_start_ms": None}
 
     def load_config(self):
         load_dotenv(ENV_FILE)
-        self.server = os.getenv("SUBSONIC_URL")
+        # Admite varios servidores separados por comas (p.ej. LAN,pública)
+        self.servers = [url.strip() for url in os.getenv("SUBSONIC_URL", "").split(",") if url.strip()]
         self.user = os.getenv("SUBSONIC_USER")
         self.password = os.getenv("SUBSONIC_PASS")
         self.port = os.getenv("SUBSONIC_PORT")
 
-        if not all([self.server, self.user, self.password]):
-            print("❌ Error: Faltan credenciales en el archivo .env")
+        if not all([self.servers, self.user, self.password]):
+            log.error(event_log.SYSTEM, "❌ Error: Faltan credenciales en el archivo .env")
+            log.flush()
             sys.exit(1)
 
     def init_subsonic(self):
-        try:
-            print(f"📡 Conectando a Subsonic: {self.server}")
-            self.conn = libsonic.Connection(
-                self.server,
-                self.user,
-                self.password,
-                port = self.port,
-                appName="JukePi"
-            )
-            # Pequeño ping para verificar
-            if not self.conn.ping():
-                print("⚠️ Advertencia: El servidor Subsonic no responde al ping.")
-        except Exception as e:
-            print(f"❌ Error conectando a Subsonic: {e}")
-
-    def init_vlc(self):
-        # Usamos '--aout=alsa' si es necesario forzar, pero pipewire suele manejarlo bien
-        # Inicializamos el reproductor de LISTAS (MediaListPlayer)
-        self.vlc_instance = vlc.Instance()
-        self.list_player = self.vlc_instance.media_list_player_new()
-        self.player = self.list_player.get_media_player() # Acceso al reproductor subyacente
+        log.info(event_log.SYSTEM, f"📡 Conectando a Subsonic: {', '.join(self.servers)}")
+        self.pool = ServerPool(self.servers, self.port, self.user, self.password)
+        # Primer ping a todos los servidores para elegir el más rápido
+        self.pool.start()
+        if all(ep.failures for ep in self.pool.endpoints):
+            log.warning(event_log.SYSTEM, "⚠️ Advertencia: El servidor Subsonic no responde al ping.")
+        self.stream_endpoint = None
+        self.playback = PlaybackStats()
+        self.scrobbler = Scrobbler(self.pool)
+        self.scrobbler.start()
+        # Historial local y precarga de los discos que probablemente sonarán
+        self.history = PlayHistory()
+        self.prefetcher = Prefetcher(self.history, self.fetch_songs, self._remote_url)
+        self.prefetcher.start()
+
+    def init_audio(self):
+        # Backend elegido con AUDIO_BACKEND (vlc por defecto, mpv como alternativa ligera)
+        self.backend = create_backend()
+        self._attach(self.backend)
+        # Reproductor de reserva para el doble buffer (se crea al primer cambio de disco)
+        self._standby = None
+        self._preparing = None
+        self._ready = threading.Event()
+        self._prepare_failed = False
+        # Cada disco nuevo, parada o reposo anula el cambio que estuviera en curso
+        self._swap_id = 0
+
+    def _attach(self, backend):
+        """Conecta los eventos de un backend: solo cuentan los del que está sonando"""
+        def active(callback):
+            def handler(**data):
+                if backend is self.backend:
+                    callback(**data)
+            return handler
+
+        backend.on("track_changed", active(self._on_track_changed))
+        backend.on("error", active(self._on_backend_error))
+        backend.on("playing", active(self.scrobbler.playing))
+        backend.on("paused", active(self.scrobbler.paused))
+        backend.on("stopped", active(self.scrobbler.track_stopped))
+        # Telemetría de buffering y estadísticas de VLC por pista
+        backend.on("buffering", active(self._on_buffering))
+        backend.on("track_stats", active(self.playback.track_finished))
+        # El de reserva avisa cuando el disco nuevo está listo (o ha fallado)
+        backend.on("buffering", lambda percent: self._on_prepared(backend, percent >= 100, False))
+        backend.on("error", lambda: self._on_prepared(backend, False, True))
+
+    def _on_buffering(self, percent):
+        self.playback.buffering(percent)
+        # Con el buffer del disco que suena lleno, la precarga ya no le quita red
+        if percent >= 100:
+            self.prefetcher.buffered()
+
+    def _on_prepared(self, backend, ready, failed):
+        if backend is self._preparing and (ready or failed):
+            self._prepare_failed = failed
+            self._ready.set()
+
+    def _on_backend_error(self):
+        log.error(event_log.PLAYBACK, "❌ Error del reproductor de audio")
+        if self.stream_endpoint is None or len(self.pool.endpoints) < 2:
+            return
+        # El stream se ha cortado: marcamos el servidor y seguimos desde otro.
+        # No se puede tocar el backend desde su propio callback.
+        self.stream_endpoint.record_failure()
+        threading.Thread(target=self._failover_stream, daemon=True).start()
+
+    def _failover_stream(self):
+        with self._lock:
+            # Un solo fallo no abre el circuito: excluimos el servidor caído a mano
+            endpoint = self.pool.best(exclude=[self.stream_endpoint])
+            if endpoint is self.stream_endpoint or not self.songs:
+                return
+            index, position, _ = self.backend.position()
+            log.warning(event_log.PLAYBACK, f"🔀 Cambiando stream a {endpoint.url}", index=index)
+            self.stream_endpoint = endpoint
+            self.backend.load_queue(self._stream_urls(self.songs, endpoint),
+                                    start_index=max(index, 0), start_ms=max(position, 0))
+            self.backend.play()
+
+    def _on_track_changed(self, index):
+        if 0 <= index < len(self.songs):
+            track = self.songs[index]
+            log.info(event_log.PLAYBACK, f"🎶 {track.title}", index=index)
+            self.scrobbler.track_started(track.id, track.duration)
+            server = self.stream_endpoint.url if self.stream_endpoint else None
+            self.playback.track_started(track, server, self.current_uri)
 
     def load_rfid_map(self):
         try:
             with open(RFID_FILE, 'r') as file:
                 return json.load(file)
         except (FileNotFoundError, json.JSONDecodeError):
-            print("⚠️ No se pudo leer rfid.json o está vacío.")
+            log.warning(event_log.SYSTEM, "⚠️ No se pudo leer rfid.json o está vacío.")
             return {}
 
     def _get_auth_params(self):
@@ -80,7 +189,7 @@ class SubsonicController:
         return f"u={quote(self.user)}&t={token}&s={salt}&v=1.16.1&c=RPiPlayer"
 
     def fetch_songs(self, uri):
-        """Devuelve una lista de diccionarios de canciones basada en la URI"""
+        """Devuelve la lista de pistas (Track) basada en la URI"""
         # uri formato: subsonic:tipo:id
         try:
             parts = uri.split(":")
@@ -90,23 +199,23 @@ class SubsonicController:
             songs = []
 
             if otype == "album":
-                print(f"📥 Obteniendo álbum ID {oid}...")
-                album = self.conn.getAlbum(oid)
+                log.info(event_log.FETCH, f"📥 Obteniendo álbum ID {oid}...")
+                album = self.pool.call("getAlbum", oid)
                 if 'album' in album and 'song' in album['album']:
                     songs = album['album']['song']
 
             elif otype == "playlist":
-                print(f"📥 Obteniendo playlist ID {oid}...")
-                pl = self.conn.getPlaylist(oid)
+                log.info(event_log.FETCH, f"📥 Obteniendo playlist ID {oid}...")
+                pl = self.pool.call("getPlaylist", oid)
                 if 'playlist' in pl and 'entry' in pl['playlist']:
                     songs = pl['playlist']['entry']
 
             elif otype == "artist":
-                artist = self.conn.getArtist(oid)
+                artist = self.pool.call("getArtist", oid)
                 artist_name = artist['artist']['name']
-                print(f"📥 Obteniendo canciones del artista {artist_name} ...")
+                log.info(event_log.FETCH, f"📥 Obteniendo canciones del artista {artist_name} ...")
 
-                results = self.conn.search3(artist_name)
+                results = self.pool.call("search3", artist_name)
                 search_result = results.get('searchResult3', {})
 
                 # 🔹 Obtener solo canciones
@@ -119,67 +228,272 @@ class SubsonicController:
                 ]
                 random.shuffle(songs)
 
-            return songs
+            # Nos quedamos solo con los campos que usa la cola
+            return [Track.from_song(song) for song in songs]
         except Exception as e:
-            print(f"❌ Error obteniendo canciones: {e}")
+            log.error(event_log.FETCH, f"❌ Error obteniendo canciones: {e}", uri=uri)
             return []
 
     def play(self, rfid_id):
         uri = self.rfid_map.get(str(rfid_id))
 
         if not uri:
-            print(f"⚠️ Etiqueta {rfid_id} no configurada.")
+            log.warning(event_log.TAG, f"⚠️ Etiqueta {rfid_id} no configurada.")
             return
 
         if uri == self.current_uri:
-            print("🔄 Misma etiqueta, ignorando...")
+            log.debug(event_log.TAG, "🔄 Misma etiqueta, ignorando...")
             return
 
-        print(f"▶️ Nueva etiqueta detectada: {uri}")
-        # 🔥 PARAR completamente la lista anterior
-        self.list_player.stop()
-        self.player.stop()  # doble seguro
+        log.info(event_log.PLAYBACK, f"▶️ Nueva etiqueta detectada: {uri}")
+        self.play_uri(uri, tag=str(rfid_id))
 
-        self.current_uri = uri
+    def play_uri(self, uri, tag=None):
+        """Reproduce una URI subsonic:tipo:id (también usado por la API de control)"""
+        start = time.monotonic()
 
-        # 1. Obtener canciones
-        songs = self.fetch_songs(uri)
+        # 1. Obtener canciones (ya resueltas si el disco estaba previsto).
+        # El disco anterior sigue sonando: si esto falla, no se corta.
+        songs = self.prefetcher.tracklist(uri) or self.fetch_songs(uri)
+        self.stats["fetches"] += 1
+        self.stats["last_fetch_ms"] = round((time.monotonic() - start) * 1000)
         if not songs:
-            print("❌ No se encontraron canciones para reproducir.")
+            self.stats["fetch_errors"] += 1
+            log.error(event_log.FETCH, "❌ No se encontraron canciones para reproducir.", uri=uri)
             return
 
-        # 2. Crear lista de reproducción VLC
-        media_list = self.vlc_instance.media_list_new()
+        with self._lock:
+            # 2. Crear cola de reproducción
+            log.info(event_log.PLAYBACK, f"🎵 Cargando {len(songs)} canciones en cola...")
+            endpoint = self.pool.best()
+            urls = self._stream_urls(songs, endpoint)
+            self._swap_id += 1
+
+            # 3. Reproducir: con doble buffer el cambio se hace en segundo plano,
+            # con el nuevo ya listo, y el bucle principal no espera
+            if DOUBLE_BUFFER and self.backend.is_playing():
+                self._prepare(uri, tag, songs, urls, endpoint, start)
+                return
+
+            self._cancel_prepare()
+            self.backend.stop()
+            self.scrobbler.track_stopped()
+            # Antes de play(): el primer track_changed ya es del disco nuevo
+            self._activate(uri, songs, endpoint)
+            self.backend.load_queue(urls)
+            self.backend.play()
+        self._started(uri, tag, start)
+
+    def _activate(self, uri, songs, endpoint):
+        self.current_uri = uri
+        self.songs = songs
+        self.stream_endpoint = endpoint
+        self.saved_state = None
+        # Antes de play(): la precarga espera al primer buffering 100 de este disco
+        self.prefetcher.played(uri)
+
+    def _started(self, uri, tag, start):
+        self.history.start(tag, uri)
+        self.stats["last_start_ms"] = round((time.monotonic() - start) * 1000)
+        log.info(event_log.PLAYBACK, "🔊 Reproduciendo...", uri=uri, ms=self.stats["last_start_ms"])
+
+    def _prepare(self, uri, tag, songs, urls, endpoint, start):
+        """
+        Carga el disco nuevo en el reproductor de reserva (sin volumen) mientras
+        el actual sigue sonando. Un hilo espera a que el nuevo tenga el buffer
+        lleno y hace el cambio; si falla, el anterior no se toca, y si tarda más
+        de SWAP_TIMEOUT se cambia igualmente, sin fundido.
+        Se llama con el lock tomado.
+        """
+        new = self._standby or self.backend.twin()
+        if self._standby is None:
+            self._attach(new)
+            self._standby = new
+
+        # El cambio anterior (si lo había) queda anulado por _swap_id
+        self._ready.set()
+        self._ready = ready = threading.Event()
+        self._prepare_failed = False
+        self._preparing = new
+        self.backend.set_volume(100)
+        new.set_volume(0)
+        new.load_queue(urls)
+        new.play()
+        threading.Thread(target=self._swap, args=(self._swap_id, ready, uri, tag, songs, endpoint, start),
+                         daemon=True, name="swap").start()
+
+    def _cancel_prepare(self):
+        """Descarta el disco en preparación (con el lock tomado)"""
+        new, self._preparing = self._preparing, None
+        self._ready.set()
+        if new is not None:
+            new.release()
+            new.set_volume(100)
+            self.backend.set_volume(100)
+
+    def _swap(self, swap_id, ready, uri, tag, songs, endpoint, start):
+        ok = ready.wait(SWAP_TIMEOUT)
+        with self._lock:
+            if swap_id != self._swap_id:
+                return
+            if self._prepare_failed:
+                log.warning(event_log.PLAYBACK, "⚠️ El disco nuevo no arranca: sigue sonando el anterior", uri=uri)
+                self._cancel_prepare()
+                return
+            old, new = self.backend, self._preparing
+
+        # Buffer lento pero sin error: cambio directo, como sin doble buffer
+        if ok:
+            self._crossfade(swap_id, old, new)
+        else:
+            log.info(event_log.PLAYBACK, "⏱️ El disco nuevo tarda en cargar: cambio sin fundido", uri=uri)
+
+        with self._lock:
+            if swap_id != self._swap_id:
+                return
+            self._preparing = None
+            # Brazo levantado durante la preparación: el nuevo queda en pausa
+            paused = not old.is_playing()
+            # El anterior se para mientras sigue siendo el activo (sus estadísticas cuentan)
+            old.stop()
+            self.scrobbler.track_stopped()
+            self._activate(uri, songs, endpoint)
+            self.backend, self._standby = new, old
+            old.release()
+            old.set_volume(100)
+            new.set_volume(100)
+            if paused:
+                new.pause()
+
+            # Los eventos del nuevo se ignoraron mientras era el de reserva
+            index, _, _ = new.position()
+            self._on_track_changed(max(index, 0))
+            if ok:
+                self._on_buffering(100)
+        self._started(uri, tag, start)
+        if paused:
+            self.history.pause()
+
+    def _crossfade(self, swap_id, old, new):
+        """Fundido sin bloquear el lock: se corta si llega otro disco o se levanta el brazo"""
+        steps = max(CROSSFADE_MS // 50, 1)
+        for step in range(1, steps + 1):
+            with self._lock:
+                if swap_id != self._swap_id or not old.is_playing():
+                    return
+                level = step / steps
+                new.set_volume(round(100 * level))
+                old.set_volume(round(100 * (1 - level)))
+            if CROSSFADE_MS:
+                time.sleep(CROSSFADE_MS / 1000 / steps)
+
+    def _stream_urls(self, songs, endpoint):
+        # Construir URL completa con autenticación, contra el servidor elegido
+        server = endpoint.base_url
         auth_params = self._get_auth_params()
-
-        print(f"🎵 Cargando {len(songs)} canciones en cola...")
-
-        for song in songs:
-            # Construir URL completa con autenticación
-            stream_url = f"{self.server}/rest/stream?id={song['id']}&{auth_params}"
-            media = self.vlc_instance.media_new(stream_url)
-            media_list.add_media(media)
-
-        # 3. Asignar y reproducir
-        self.list_player.set_media_list(media_list)
-        self.list_player.play()
-        print("🔊 Reproduciendo...")
+        # Las pistas precargadas suenan desde disco, sin esperar a la red
+        return [self.prefetcher.local_url(track) or f"{server}/rest/stream?id={track.id}&{auth_params}"
+                for track in songs]
+
+    def _remote_url(self, track):
+        return f"{self.pool.best().base_url}/rest/stream?id={track.id}&{self._get_auth_params()}"
+
+    def release(self):
+        """
+        Modo reposo: guarda la posición y libera la media y la conexión HTTP
+        del stream. El motor de audio se conserva para reanudar rápido.
+        """
+        self.pool.suspend()
+        self.prefetcher.suspend()
+        with self._lock:
+            self._swap_id += 1
+            self._cancel_prepare()
+            if not self.songs or self.saved_state:
+                return
+
+            index, position, _ = self.backend.position()
+            self.saved_state = (max(index, 0), max(position, 0))
+
+            self.backend.release()
+        log.info(event_log.PLAYBACK, "💤 Recursos de audio liberados",
+                 index=self.saved_state[0], ms=self.saved_state[1])
+
+    def _restore(self):
+        """Reconstruye la cola desde el estado guardado, sin volver a pedirla al servidor"""
+        index, position = self.saved_state
+        self.saved_state = None
+        self.stream_endpoint = self.pool.best()
+        self.backend.load_queue(self._stream_urls(self.songs, self.stream_endpoint),
+                                start_index=index, start_ms=position)
+        self.backend.play()
+        log.info(event_log.PLAYBACK, "♻️ Reproducción restaurada", index=index, ms=position)
 
     def pause(self):
         """Pausa o detiene la reproducción (simulando levantar la aguja)"""
-        if self.list_player.is_playing():
-            print("⏸️ Pausando reproducción...")
-            self.list_player.pause() # O usar .stop() si quieres reiniciar al poner la aguja
+        with self._lock:
+            if self.backend.is_playing():
+                log.info(event_log.PLAYBACK, "⏸️ Pausando reproducción...")
+                self.backend.pause() # O usar .stop() si quieres reiniciar al poner la aguja
+        self.history.pause()
 
     def resume(self):
         """Reanuda si estaba pausado"""
-        if not self.list_player.is_playing() and self.current_uri:
-             print("▶️ Reanudando...")
-             self.list_player.play()
+        self.pool.resume()
+        self.prefetcher.resume()
+        self.history.resume()
+        with self._lock:
+            if self.saved_state and self.songs:
+                self._restore()
+            elif not self.backend.is_playing() and self.current_uri:
+                 log.info(event_log.PLAYBACK, "▶️ Reanudando...")
+                 self.backend.resume()
+
+    def next(self):
+        """Salta a la siguiente canción de la cola"""
+        log.info(event_log.PLAYBACK, "⏭️ Siguiente canción")
+        with self._lock:
+            self.backend.next()
+
+    def reload_rfid_map(self):
+        self.rfid_map = self.load_rfid_map()
+        log.info(event_log.SYSTEM, f"🔁 rfid.json recargado ({len(self.rfid_map)} etiquetas)")
+
+    def status(self):
+        """Foto del estado de reproducción (solo lecturas, sin tocar la cola)"""
+        index, position, length = self.backend.position()
+        return {
+            "uri": self.current_uri,
+            "backend": self.backend.name,
+            "playing": self.backend.is_playing(),
+            "index": index,
+            "position_ms": position,
+            "length_ms": length,
+            "queue": [track.title for track in self.songs],
+            "released": self.saved_state is not None,
+            "servers": self.pool.status(),
+            "scrobbles": self.scrobbler.status(),
+            "stats": dict(self.stats),
+            "playback": self.playback.status(),
+            "history": self.history.status(),
+            "prefetch": self.prefetcher.status(),
+        }
 
     def stop(self):
-        self.list_player.stop()
-        self.current_uri = None
+        with self._lock:
+            self._swap_id += 1
+            self._cancel_prepare()
+            self.backend.stop()
+            self.scrobbler.track_stopped()
+            self.current_uri = None
+            self.saved_state = None
+        self.history.finish()
+
+    def shutdown(self):
+        """Cierre ordenado: guarda los scrobbles pendientes y para los hilos"""
+        self.history.finish()
+        self.prefetcher.stop()
+        self.scrobbler.stop()
+        self.pool.stop()
 
 class StepperMotor:
     STEP_SEQUENCE = [
@@ -188,20 +502,30 @@ class StepperMotor:
     ]
     STEP_DELAY = 0.002 # Ajustar velocidad aquí
 
-    def __init__(self):
+    def __init__(self, profiler=None, clock=REAL_CLOCK):
         self.pins = [DigitalOutputDevice(pin) for pin in STEPPER_PINS]
+        self.profiler = profiler
+        self.clock = clock
         self._running = False
         self._thread = None
 
     def _run(self):
-        print("⚙️ Motor: Iniciando giro")
+        log.info(event_log.MOTOR, "⚙️ Motor: Iniciando giro")
+        profiler = self.profiler
+        clock = self.clock
         while self._running:
             for step in self.STEP_SEQUENCE:
                 for pin, value in zip(self.pins, step):
                     pin.value = value
-                time.sleep(self.STEP_DELAY)
+                if profiler:
+                    # Retraso real del despertar respecto a STEP_DELAY
+                    start = clock.monotonic()
+                    clock.sleep(self.STEP_DELAY)
+                    profiler.step_lateness(clock.monotonic() - start - self.STEP_DELAY)
+                else:
+                    clock.sleep(self.STEP_DELAY)
         self._stop_pins()
-        print("⚙️ Motor: Detenido")
+        log.info(event_log.MOTOR, "⚙️ Motor: Detenido")
 
     def start(self):
         if self._thread and self._thread.is_alive():
@@ -213,23 +537,105 @@ class StepperMotor:
     def stop(self):
         self._running = False
 
+    def release(self):
+        """Espera a que el hilo termine y deja las bobinas sin corriente"""
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+        self._stop_pins()
+
     def _stop_pins(self):
         for pin in self.pins:
             pin.off()
 
+class HallFilter:
+    """
+    Antirrebote con histéresis para el sensor del brazo.
+
+    Cada lectura de `value` muestrea el sensor y la integra en una media
+    ponderada por tiempo. El estado solo pasa a activo cuando la media supera
+    HALL_ENGAGE_THRESHOLD durante HALL_ENGAGE_SETTLE segundos, y solo vuelve
+    a inactivo por debajo de HALL_RELEASE_THRESHOLD durante
+    HALL_RELEASE_SETTLE. Un A3144 que rebota o un imán al límite de alcance
+    ya no arranca y para el motor (y re-bufferiza el stream) en cada lectura.
+    """
+
+    def __init__(self, sensor,
+                 engage_settle=HALL_ENGAGE_SETTLE, release_settle=HALL_RELEASE_SETTLE,
+                 engage_threshold=HALL_ENGAGE_THRESHOLD, release_threshold=HALL_RELEASE_THRESHOLD,
+                 time_constant=HALL_TIME_CONSTANT, clock=REAL_CLOCK):
+        self.sensor = sensor
+        self.engage_settle = engage_settle
+        self.release_settle = release_settle
+        self.engage_threshold = engage_threshold
+        self.release_threshold = release_threshold
+        self.time_constant = time_constant
+        self.clock = clock
+
+        self.state = bool(sensor.value)
+        self.level = 1.0 if self.state else 0.0
+        self._last_sample = None
+        self._crossed_at = None   # desde cuándo la media está al otro lado del umbral
+
+    @property
+    def value(self):
+        now = self.clock.monotonic()
+        raw = 1.0 if self.sensor.value else 0.0
+
+        if self._last_sample is None:
+            self.level = raw
+        else:
+            alpha = 1 - math.exp(-(now - self._last_sample) / self.time_constant)
+            self.level += alpha * (raw - self.level)
+        self._last_sample = now
+
+        if self.state:
+            crossed, settle = self.level <= self.release_threshold, self.release_settle
+        else:
+            crossed, settle = self.level >= self.engage_threshold, self.engage_settle
+
+        if not crossed:
+            self._crossed_at = None
+        elif self._crossed_at is None:
+            self._crossed_at = now
+        if crossed and now - self._crossed_at >= settle:
+            self.state = not self.state
+            self._crossed_at = None
+
+        return self.state
+
+    def wait_for_active(self, timeout=None):
+        # El flanco lo detecta el sensor real; el filtro confirma en el siguiente update()
+        return self.sensor.wait_for_active(timeout)
+
 class FakeHallSensor:
-    def __init__(self):
+    def __init__(self, clock=REAL_CLOCK):
         self.value = False
+        self.clock = clock
+        self._active = threading.Event()
+
+    def wait_for_active(self, timeout=None):
+        return self.clock.wait(self._active, timeout)
+
+    def set_value(self, value):
+        """Cambio silencioso (para simular ruido sin llenar el log)"""
+        self.value = value
+        if value:
+            self._active.set()
+        else:
+            self._active.clear()
 
     def activate(self):
         if not self.value: # Solo imprimir si cambia el estado
-            print("\n🧪 [MOCK] Brazo bajado (Imán detectado)")
+            log.info(event_log.ARM, "🧪 [MOCK] Brazo bajado (Imán detectado)")
             self.value = True
+            self._active.set()
 
     def deactivate(self):
         if self.value:
-            print("\n🧪 [MOCK] Brazo levantado (Sin imán)")
+            log.info(event_log.ARM, "🧪 [MOCK] Brazo levantado (Sin imán)")
             self.value = False
+            self._active.clear()
 
 class FakeRFID:
     def __init__(self):
@@ -242,34 +648,91 @@ class FakeRFID:
 
     def set_id(self, new_id):
         if self.fake_id != new_id:
-            print(f"🧪 [MOCK] Acercando etiqueta RFID: {new_id}")
+            log.info(event_log.TAG, f"🧪 [MOCK] Acercando etiqueta RFID: {new_id}")
             self.fake_id = new_id
 
     def remove_card(self):
         if self.fake_id is not None:
-            print("🧪 [MOCK] Retirando etiqueta RFID")
+            log.info(event_log.TAG, "🧪 [MOCK] Retirando etiqueta RFID")
             self.fake_id = None
 
 class FakeMotor:
+    def __init__(self, clock=REAL_CLOCK):
+        self.clock = clock
+        self.history = []  # (instante, estado) para comprobar tiempos en simulación
+
     def start(self):
-        print("⚙️ [MOCK] Motor: GIRANDO")
+        log.info(event_log.MOTOR, "⚙️ [MOCK] Motor: GIRANDO")
+        self.history.append((self.clock.monotonic(), "start"))
 
     def stop(self):
-        print("⚙️ [MOCK] Motor: DETENIDO")
+        log.info(event_log.MOTOR, "⚙️ [MOCK] Motor: DETENIDO")
+        self.history.append((self.clock.monotonic(), "stop"))
+
+    def release(self):
+        log.info(event_log.MOTOR, "⚙️ [MOCK] Motor: BOBINAS LIBERADAS")
+        self.history.append((self.clock.monotonic(), "release"))
+
+class FakeAudio:
+    """Controlador de audio simulado: registra cada llamada con su instante"""
+    def __init__(self, clock=REAL_CLOCK):
+        self.clock = clock
+        self.calls = []
+
+    def _record(self, name, *args):
+        self.calls.append((self.clock.monotonic(), name) + args)
+
+    def play(self, rfid_id):
+        self._record("play", rfid_id)
+
+    def pause(self):
+        self._record("pause")
+
+    def resume(self):
+        self._record("resume")
+
+    def release(self):
+        self._record("release")
+
+    def stop(self):
+        self._record("stop")
 
 
 
 class RecordPlayer:
-    def __init__(self, audio_controller, motor, rfid, hall_sensor):
+    def __init__(self, audio_controller, motor, rfid, hall_sensor, idle_timeout=IDLE_TIMEOUT,
+                 profiler=None, clock=REAL_CLOCK):
         self.audio = audio_controller
         self.motor = motor
         self.rfid = rfid
         self.hall_sensor = hall_sensor
+        self.profiler = profiler
+        self.clock = clock
 
         self.current_rfid = None
         self.spinning = False
 
+        # Máquina de estados de reposo: GIRANDO -> PARADO -> REPOSO
+        self.idle_timeout = idle_timeout
+        self.idle = False
+        self._stopped_since = clock.monotonic()
+        # Como en el diseño original, el lector solo se lee mientras gira
+        self._rfid_active(False)
+
+    def _rfid_active(self, active):
+        # El broker deja de sondear el RC522 cuando ningún cliente lo necesita
+        if hasattr(self.rfid, "set_active"):
+            self.rfid.set_active(active)
+
     def update(self):
+        if self.profiler:
+            self.profiler.tick_start()
+            self._update()
+            self.profiler.tick_end()
+        else:
+            self._update()
+
+    def _update(self):
         # Leemos el sensor Hall (Brazo del tocadiscos)
         # Nota: pull_up=True significa que detecta imán cuando va a tierra (0) o viceversa
         # Ajusta lógica según tu montaje físico del sensor
@@ -277,16 +740,23 @@ class RecordPlayer:
 
         # ESTADO: COMIENZA A GIRAR (Brazo se mueve hacia el disco)
         if magnet_detected and not self.spinning:
-            print("🧲 Brazo activado -> Arrancando motor")
+            if self.idle:
+                # Solo salimos de reposo cuando el filtro confirma el brazo
+                log.info(event_log.ARM, "⏰ Brazo activado -> Saliendo de reposo")
+                self.idle = False
+            log.info(event_log.ARM, "🧲 Brazo activado -> Arrancando motor")
             self.spinning = True
+            self._rfid_active(True)
             self.motor.start()
             # Si había música pausada, intentamos reanudar
             self.audio.resume()
 
         # ESTADO: PARA DE GIRAR (Brazo vuelve al reposo)
         elif not magnet_detected and self.spinning:
-            print("🧲 Brazo desactivado -> Deteniendo")
+            log.info(event_log.ARM, "🧲 Brazo desactivado -> Deteniendo")
             self.spinning = False
+            self._stopped_since = self.clock.monotonic()
+            self._rfid_active(False)
             self.motor.stop()
             self.audio.pause() # O self.audio.stop() para resetear totalmente
 
@@ -294,42 +764,83 @@ class RecordPlayer:
         if self.spinning:
             rfid_id = self.rfid.read_id_no_block()
             if rfid_id and rfid_id != self.current_rfid:
-                print(f"🏷️ Etiqueta detectada: {rfid_id}")
+                log.info(event_log.TAG, f"🏷️ Etiqueta detectada: {rfid_id}")
                 self.current_rfid = rfid_id
                 self.audio.play(rfid_id)
 
+        # PARADO DEMASIADO TIEMPO: pasar a reposo profundo
+        elif (self.idle_timeout and not self.idle
+                and self.clock.monotonic() - self._stopped_since >= self.idle_timeout):
+            self.enter_idle()
+
+    def enter_idle(self):
+        log.info(event_log.ARM, "💤 Brazo en reposo prolongado -> Modo reposo")
+        self.idle = True
+        self.audio.release()
+        self.motor.release()
+
+    def sleep_until_wake(self, timeout=None):
+        """
+        Bloquea sin sondear hasta que el sensor Hall detecte el brazo.
+        Devuelve True si el sensor se ha activado; el siguiente update()
+        lo confirma con el filtro, así un rebote suelto no saca del reposo.
+        """
+        return self.hall_sensor.wait_for_active(timeout)
+
+def install_dump_handler():
+    """SIGUSR1 vuelca los últimos eventos a disco para análisis post-mortem"""
+    def handler(signum, frame):
+        path = log.dump_to_file()
+        log.info(event_log.SYSTEM, f"📝 Eventos volcados en {path}")
+    signal.signal(signal.SIGUSR1, handler)
+
 def main():
     print("=========================================")
     print("   RPi Subsonic Record Player v2.0      ")
     print("=========================================")
 
+    log.start()
+    install_dump_handler()
+
     # Inicializar controladores
     try:
+        profiler = create_profiler()
         subsonic = SubsonicController()
-        motor = StepperMotor()
-        rfid = SimpleMFRC522()
+        motor = StepperMotor(profiler=profiler)
+        # El lector lo gestiona el broker (rfid_broker.py): lo comparten reproductor y programador
+        rfid = create_reader()
         # Ajustar pin_factory si da problemas en Pi Zero 2, LGPIO es el estándar moderno
-        hall_sensor = DigitalInputDevice(HALL_SENSOR_PIN, pull_up=True, pin_factory=LGPIOFactory())
+        hall_sensor = HallFilter(DigitalInputDevice(HALL_SENSOR_PIN, pull_up=True, pin_factory=LGPIOFactory()))
 
         player = RecordPlayer(
             audio_controller=subsonic,
             motor=motor,
             rfid=rfid,
             hall_sensor=hall_sensor,
+            profiler=profiler,
         )
 
-        print("✅ Sistema listo. Esperando acción del brazo...")
+        control = ControlServer(player)
+        control.start()
+
+        log.info(event_log.SYSTEM, "✅ Sistema listo. Esperando acción del brazo...")
 
         while True:
             player.update()
+            if player.idle:
+                # Sin sondeo: esperamos el flanco del sensor Hall
+                player.sleep_until_wake()
             time.sleep(0.1)
 
     except KeyboardInterrupt:
-        print("\n👋 Apagando sistema...")
+        log.info(event_log.SYSTEM, "👋 Apagando sistema...")
     except Exception as e:
-        print(f"❌ Error inesperado: {e}")
+        log.error(event_log.SYSTEM, f"❌ Error inesperado: {e}")
     finally:
         if 'motor' in locals(): motor.stop()
+        if 'control' in locals(): control.stop()
+        if 'subsonic' in locals(): subsonic.shutdown()
+        log.stop()
         # GPIO cleanup a veces es redundante con gpiozero, pero por seguridad si usas librerías mixtas
         try:
             import RPi.GPIO as GPIO
@@ -342,17 +853,25 @@ def main_test():
     print("   MODO TEST: SIMULACIÓN DE HARDWARE     ")
     print("=========================================")
 
+    log.start()
+    install_dump_handler()
+
+    profiler = create_profiler()
     subsonic = SubsonicController()
     motor = FakeMotor()        # o StepperMotor si quieres
     rfid = FakeRFID() # ID existente en rfid.json
-    hall_sensor = FakeHallSensor()
+    fake_hall = FakeHallSensor()
 
     player = RecordPlayer(
             audio_controller=subsonic,
             motor=motor,
             rfid=rfid,
-            hall_sensor=hall_sensor,
+            hall_sensor=HallFilter(fake_hall),
+            profiler=profiler,
         )
+    control = ControlServer(player)
+    control.start()
+
 # Variables para controlar la línea de tiempo
     start_time = time.time()
 
@@ -370,6 +889,8 @@ def main_test():
         while True:
             # 1. Ejecutar la lógica del reproductor (lo que haría la RPi)
             player.update()
+            if player.idle:
+                player.sleep_until_wake(timeout=0.1)
 
             # 2. Calcular tiempo transcurrido
             elapsed = time.time() - start_time
@@ -378,7 +899,7 @@ def main_test():
 
             # T+2s: Bajar el brazo (Activar sensor)
             if elapsed > 2 and not events_triggered["arm_down"]:
-                hall_sensor.activate()
+                fake_hall.activate()
                 events_triggered["arm_down"] = True
 
             # T+4s: Colocar tarjeta RFID (ID de prueba que tengas en rfid.json)
@@ -389,12 +910,12 @@ def main_test():
 
             # T+20s: Levantar el brazo (Canción termina o usuario para)
             if elapsed > 20 and not events_triggered["arm_up"]:
-                hall_sensor.deactivate()
+                fake_hall.deactivate()
                 events_triggered["arm_up"] = True
-                print("\n✅ Test finalizado. Saliendo en 3 segundos...")
+                log.info(event_log.SYSTEM, "✅ Test finalizado. Saliendo en 3 segundos...")
 
             if elapsed > 30 and not events_triggered["arm_down2"]:
-                hall_sensor.activate()
+                fake_hall.activate()
                 events_triggered["arm_down2"] = True
 
             # Salir del script poco después de terminar
@@ -406,9 +927,167 @@ def main_test():
 
     except KeyboardInterrupt:
         print("\nTest cancelado por usuario.")
+    finally:
+        control.stop()
+        subsonic.shutdown()
+        log.stop()
+
+def main_noise_test():
+    print("=========================================")
+    print("   MODO TEST: RUIDO EN EL SENSOR HALL    ")
+    print("=========================================")
+
+    # Línea de tiempo simulada (sin esperas reales), con semilla fija
+    rng = random.Random(1234)
+    ok = True
+
+    def brazo(t):
+        """Brazo bajado entre 1 s y 6 s, y de nuevo entre 9 s y 12 s"""
+        return 1 <= t < 6 or 9 <= t < 12
+
+    def lectura(t):
+        # Rebotes de 80 ms en cada flanco
+        for edge in (1, 6, 9, 12):
+            if edge <= t < edge + 0.08:
+                return rng.random() < 0.5
+        # Imán al límite de alcance entre 3 s y 4 s: falla el 40% de lecturas
+        if 3 <= t < 4:
+            return rng.random() < 0.6
+        # Fallos sueltos del 5% el resto del tiempo
+        return brazo(t) != (rng.random() < 0.05)
+
+    for period in (0.1, 0.02, 0.005):
+        clock = VirtualClock()
+        fake_hall = FakeHallSensor(clock)
+        hall_filter = HallFilter(fake_hall, clock=clock)
+        raw_changes = filtered_changes = 0
+        last_raw = last_filtered = False
+        delays = {True: [], False: []}
+        edge_at = None
+
+        while clock.monotonic() < 14:
+            now = clock.monotonic()
+            fake_hall.set_value(lectura(now))
+            filtered = hall_filter.value
+            if fake_hall.value != last_raw:
+                raw_changes += 1
+                last_raw = fake_hall.value
+            if brazo(now) != brazo(now - period) and now > 0:
+                edge_at = now
+            if filtered != last_filtered:
+                filtered_changes += 1
+                last_filtered = filtered
+                if edge_at is not None:
+                    delays[filtered].append(now - edge_at)
+                    edge_at = None
+            clock.advance(period)
+
+        passed = filtered_changes == 4
+        ok = ok and passed
+        print(f"{'✅' if passed else '❌'} Muestreo cada {period * 1000:.0f} ms: "
+              f"{raw_changes} cambios en bruto -> {filtered_changes} filtrados "
+              f"(esperados 4), retardo máx bajar/levantar "
+              f"{max(delays[True], default=0) * 1000:.0f}/{max(delays[False], default=0) * 1000:.0f} ms")
+
+    sys.exit(0 if ok else 1)
+
+# --- SIMULACIÓN ACELERADA ---
+SIM_TAG = 856425748622
+SIM_IDLE_TIMEOUT = 60
+# Retardo máximo aceptado entre el movimiento del brazo y el motor
+SIM_MAX_ARM_DELAY = 2.0
+
+def run_simulation(seed, clock):
+    """
+    Ejecuta el guion de main_test (más un reposo completo) con reloj
+    virtual, sensor Hall con ruido y audio/motor simulados. Devuelve la
+    lista de fallos encontrados (vacía si todo es correcto).
+    """
+    rng = random.Random(seed)
+    fake_hall = FakeHallSensor(clock)
+    rfid = FakeRFID()
+    motor = FakeMotor(clock)
+    audio = FakeAudio(clock)
+    player = RecordPlayer(
+            audio_controller=audio,
+            motor=motor,
+            rfid=rfid,
+            hall_sensor=HallFilter(fake_hall, clock=clock),
+            idle_timeout=SIM_IDLE_TIMEOUT,
+            clock=clock,
+        )
+
+    # Brazo bajado en [2, 20) y de nuevo desde 100 s (tras el reposo)
+    edges = (2, 20, 100)
+    def brazo(t):
+        return 2 <= t < 20 or t >= 100
+
+    end = 110
+    glitch = False
+    while clock.monotonic() < end:
+        t = clock.monotonic()
+        # Rebotes de 80 ms en cada flanco y un 5% de lecturas falsas sueltas
+        if any(edge <= t < edge + 0.08 for edge in edges):
+            raw = rng.random() < 0.5
+        else:
+            glitch = not glitch and rng.random() < 0.05
+            raw = brazo(t) != glitch
+        if raw:
+            fake_hall.activate()
+        else:
+            fake_hall.deactivate()
+        if t >= 4:
+            rfid.set_id(SIM_TAG)
+
+        player.update()
+        if player.idle:
+            player.sleep_until_wake(timeout=0.1)
+        clock.sleep(0.1)
+
+    errors = []
+    motor_states = [state for _, state in motor.history]
+    if motor_states != ["start", "stop", "release", "start"]:
+        errors.append(f"motor: {motor_states}")
+    else:
+        (started, _), (stopped, _), (released, _), (restarted, _) = motor.history
+        for name, at, edge in (("arranque", started, 2), ("parada", stopped, 20), ("despertar", restarted, 100)):
+            if not edge <= at <= edge + SIM_MAX_ARM_DELAY:
+                errors.append(f"{name} a {at:.2f} s")
+        if not stopped + SIM_IDLE_TIMEOUT <= released <= stopped + SIM_IDLE_TIMEOUT + 0.2:
+            errors.append(f"reposo a {released:.2f} s")
+
+    calls = [call[1:] for call in audio.calls]
+    expected = [("resume",), ("play", SIM_TAG), ("pause",), ("release",), ("resume",)]
+    if calls != expected:
+        errors.append(f"audio: {calls}")
+    return errors
+
+def main_sim_test():
+    print("=========================================")
+    print("   MODO TEST: SIMULACIÓN ACELERADA       ")
+    print("=========================================")
+
+    # Reloj virtual: cada ejecución simula 110 s de uso en milisegundos
+    runs = int(os.getenv("SIM_RUNS", 200))
+    started = time.perf_counter()
+    failures = 0
+    for seed in range(runs):
+        errors = run_simulation(seed, VirtualClock())
+        if errors:
+            failures += 1
+            print(f"❌ Semilla {seed}: {'; '.join(errors)}")
+
+    elapsed = time.perf_counter() - started
+    print(f"{'✅' if not failures else '❌'} {runs - failures}/{runs} simulaciones correctas "
+          f"({runs * 110 / 60:.0f} min simulados en {elapsed:.2f} s reales)")
+    sys.exit(1 if failures else 0)
 
 if __name__ == "__main__":
     if os.getenv("MODE") == "test":
         main_test()
+    elif os.getenv("MODE") == "test-noise":
+        main_noise_test()
+    elif os.getenv("MODE") == "test-sim":
+        main_sim_test()
     else:
         main()
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+# Socket Unix del broker (vacío = el reproductor abre el lector directamente)
+RFID_BROKER_SOCKET = os.getenv("RFID_BROKER_SOCKET", "/tmp/rfid-broker.sock")
+# Intervalo entre lecturas del RC522
+RFID_POLL_INTERVAL = float(os.getenv("RFID_POLL_INTERVAL", 0.05))
+# Lecturas vacías seguidas para dar la etiqueta por retirada: el RC522
+# alterna lecturas vacías aunque la tarjeta siga encima
+RFID_REMOVE_AFTER = int(os.getenv("RFID_REMOVE_AFTER", 5))
+# Espera entre reintentos del cliente si el broker no está disponible
+RFID_RECONNECT_DELAY = 1.0
+
+
+def _message(event, tag):
+    return (json.dumps({"event": event, "id": tag, "ts": time.time()}) + "\n").encode()
+
+
+class RFIDBroker:
+    """
+    Proceso dueño del lector RC522 (SPI). Sondea el lector y publica en un
+    socket Unix un evento JSON por línea cuando se acerca ("tag") o se
+    retira ("removed") una etiqueta, a todos los suscriptores conectados.
+
+    Así el reproductor y el programador de etiquetas comparten el lector
+    sin pelearse por el bus SPI ni parar el servicio.
+
+    Cada suscriptor puede enviar "active" o "idle" (una línea) según
+    necesite lecturas; el RC522 solo se sondea mientras alguno esté activo,
+    así que con el reproductor parado o en reposo el SPI queda en silencio.
+    """
+
+    def __init__(self, reader, path=RFID_BROKER_SOCKET,
+                 poll_interval=RFID_POLL_INTERVAL, remove_after=RFID_REMOVE_AFTER):
+        self.reader = reader
+        self.path = path
+        self.poll_interval = poll_interval
+        self.remove_after = remove_after
+        self.tag = None
+        self._misses = 0
+        self._subscribers = {}      # writer -> necesita lecturas
+        self._wanted = None         # asyncio.Event: algún suscriptor activo
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rc522")
+
+    # --- LECTOR ---
+
+    def _publish(self, event, tag):
+        data = _message(event, tag)
+        for writer in list(self._subscribers):
+            # Un suscriptor que no lee no debe frenar a los demás
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > 65536:
+                self._unsubscribe(writer)
+                writer.close()
+                continue
+            writer.write(data)
+
+    def _update(self, rfid_id):
+        """Convierte lecturas sueltas en eventos de llegada y retirada"""
+        if rfid_id is not None:
+            self._misses = 0
+            if rfid_id != self.tag:
+                self.tag = rfid_id
+                log.info(event_log.TAG, f"🏷️ Etiqueta en el lector: {rfid_id}",
+                         subscribers=len(self._subscribers))
+                self._publish("tag", rfid_id)
+        elif self.tag is not None:
+            self._misses += 1
+            if self._misses >= self.remove_after:
+                log.info(event_log.TAG, f"🏷️ Etiqueta retirada: {self.tag}")
+                self._publish("removed", self.tag)
+                self.tag = None
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._wanted.is_set():
+                log.debug(event_log.TAG, "💤 Nadie necesita el lector: sondeo en pausa")
+                await self._wanted.wait()
+                log.debug(event_log.TAG, "📡 Sondeo del lector reanudado")
+            try:
+                rfid_id = await loop.run_in_executor(self._executor, self.reader.read_id_no_block)
+            except Exception as e:
+                log.warning(event_log.TAG, f"⚠️ Error leyendo el RC522: {e}")
+                rfid_id = None
+            self._update(rfid_id)
+            await asyncio.sleep(self.poll_interval)
+
+    # --- SUSCRIPTORES ---
+
+    def _set_active(self, writer, active):
+        self._subscribers[writer] = active
+        if any(self._subscribers.values()):
+            self._wanted.set()
+        else:
+            self._wanted.clear()
+
+    def _unsubscribe(self, writer):
+        if self._subscribers.pop(writer, None) is not None and not any(self._subscribers.values()):
+            self._wanted.clear()
+
+    async def _handle(self, reader, writer):
+        # Activo por defecto: un cliente que no dice nada recibe lecturas
+        self._set_active(writer, True)
+        log.debug(event_log.SYSTEM, "📡 Nuevo suscriptor RFID", subscribers=len(self._subscribers))
+        # El recién llegado recibe la etiqueta que ya está sobre el lector
+        if self.tag is not None:
+            writer.write(_message("tag", self.tag))
+        try:
+            # Los suscriptores solo envían su estado ("active" / "idle")
+            async for line in reader:
+                state = line.decode().strip()
+                if state in ("active", "idle"):
+                    self._set_active(writer, state == "active")
+        except ConnectionError:
+            pass
+        finally:
+            self._unsubscribe(writer)
+            writer.close()
+
+    async def serve(self):
+        self._wanted = asyncio.Event()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        server = await asyncio.start_unix_server(self._handle, path=self.path)
+        log.info(event_log.SYSTEM, f"📡 Broker RFID escuchando en {self.path}")
+        async with server:
+            await self._poll()
+
+
+class BrokerRFID:
+    """
+    Cliente del broker con la interfaz de SimpleMFRC522 que usan el
+    reproductor y el programador de etiquetas. Un hilo mantiene la conexión
+    (reconectando si el broker se reinicia) y guarda la última etiqueta, así
+    que read_id_no_block() no toca el socket.
+
+    set_active(False) avisa al broker de que este cliente no necesita
+    lecturas (p.ej. el reproductor con el brazo levantado).
+    """
+
+    def __init__(self, path=RFID_BROKER_SOCKET, active=True):
+        self.path = path
+        self.active = active
+        self.tag = None
+        self._last_arrival = None
+        self._arrivals = 0
+        self._cond = threading.Condition()
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="rfid-client")
+        self._thread.start()
+
+    def _on_message(self, message):
+        with self._cond:
+            if message["event"] == "tag":
+                self.tag = self._last_arrival = message["id"]
+                self._arrivals += 1
+                self._cond.notify_all()
+            elif message["event"] == "removed":
+                self.tag = None
+
+    def _run(self):
+        warned = False
+        while not self._stop.is_set():
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(self.path)
+                    with self._send_lock:
+                        self._sock = sock
+                        # El broker nos da por activos: le decimos si no es así
+                        if not self.active:
+                            sock.sendall(b"idle\n")
+                    if warned:
+                        log.info(event_log.TAG, "📡 Conectado de nuevo al broker RFID")
+                        warned = False
+                    for line in sock.makefile("r"):
+                        self._on_message(json.loads(line))
+            except (OSError, ValueError) as e:
+                if not warned and not self._stop.is_set():
+                    log.warning(event_log.TAG, f"📡 Broker RFID no disponible ({e}), reintentando...")
+                    warned = True
+            finally:
+                self._sock = None
+            with self._cond:
+                self.tag = None
+            self._stop.wait(RFID_RECONNECT_DELAY)
+
+    def set_active(self, active):
+        """Pide al broker que sondee el lector (o que pare si nadie más lo necesita)"""
+        with self._send_lock:
+            if active == self.active:
+                return
+            self.active = active
+            if self._sock:
+                try:
+                    self._sock.sendall(b"active\n" if active else b"idle\n")
+                except OSError:
+                    pass  # al reconectar se envía el estado actual
+
+    def read_id_no_block(self):
+        """Etiqueta sobre el lector ahora mismo, o None"""
+        return self.tag
+
+    def read_id(self, timeout=None):
+        """
+        Como SimpleMFRC522.read_id(): devuelve la etiqueta que está sobre el
+        lector, o bloquea hasta que se acerque una (None si vence timeout)
+        """
+        with self._cond:
+            if self.tag is not None:
+                return self.tag
+            seen = self._arrivals
+            if not self._cond.wait_for(lambda: self._arrivals != seen, timeout):
+                return None
+            return self._last_arrival
+
+    def close(self):
+        self._stop.set()
+        sock = self._sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(timeout=2)
+
+
+def create_reader(fallback=False):
+    """
+    Lector para el reproductor: cliente del broker si RFID_BROKER_SOCKET está
+    configurado. Con fallback=True se abre el RC522 directamente cuando el
+    broker no está en marcha (nadie más está usando el SPI).
+    """
+    if RFID_BROKER_SOCKET and (not fallback or os.path.exists(RFID_BROKER_SOCKET)):
+        return BrokerRFID()
+    from mfrc522 import SimpleMFRC522
+    return SimpleMFRC522()
+
+
+def main():
+    from mfrc522 import SimpleMFRC522
+
+    log.start()
+    broker = RFIDBroker(SimpleMFRC522())
+    try:
+        asyncio.run(broker.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        log.stop()
+        if os.path.exists(broker.path):
+            os.unlink(broker.path)
+        try:
+            import RPi.GPIO as GPIO
+            GPIO.cleanup()
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    # Uso: python rfid_broker.py        -> arranca el broker (servicio rfid-broker)
+    #      python rfid_broker.py watch  -> muestra los eventos del broker
+    if sys.argv[1:] == ["watch"]:
+        client = BrokerRFID()
+        last = None
+        try:
+            # read_id() devuelve ya la etiqueta presente: mostramos solo los cambios
+            while True:
+                tag = client.read_id_no_block()
+                if tag != last:
+                    print(f"🏷️ {tag}" if tag is not None else "🏷️ (retirada)")
+                    last = tag
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            client.close()
+    else:
+        main()
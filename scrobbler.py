@@ -0,0 +1,165 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+SCROBBLE_QUEUE_FILE = os.getenv("SCROBBLE_QUEUE_FILE", "scrobbles.json")
+# Cada cuánto se envía el lote de scrobbles pendientes
+SCROBBLE_BATCH_INTERVAL = float(os.getenv("SCROBBLE_BATCH_INTERVAL", 30))
+# Reglas habituales (Last.fm): pista > 30 s y escuchada la mitad o 4 minutos
+SCROBBLE_MIN_TRACK = 30
+SCROBBLE_MIN_FRACTION = 0.5
+SCROBBLE_MIN_SECONDS = 240
+
+
+class Scrobbler:
+    """
+    Envía "now playing" y scrobbles al servidor desde un hilo propio.
+
+    Los callbacks de cambio de pista solo anotan el evento en una cola en
+    memoria, así que no añaden latencia a las transiciones ni al bucle de
+    control. El hilo agrupa los envíos y, si el servidor no responde, guarda
+    los scrobbles pendientes en disco para reenviarlos más tarde.
+    """
+
+    def __init__(self, pool, path=SCROBBLE_QUEUE_FILE, interval=SCROBBLE_BATCH_INTERVAL):
+        self.pool = pool
+        self.path = path
+        self.interval = interval
+        self._on_disk = self._load()
+        self._pending = deque(self._on_disk)  # (song_id, timestamp)
+        self._now_playing = None
+        self._lock = threading.Lock()
+        self._current = None                  # [song_id, duración, inicio, segundos escuchados, reanudado en]
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.sent = 0
+
+    # --- EVENTOS DE REPRODUCCIÓN (camino rápido) ---
+
+    def track_started(self, song_id, duration):
+        now = time.monotonic()
+        with self._lock:
+            if self._current and self._current[0] == song_id:
+                # Misma pista recargada (reposo o cambio de servidor): seguimos contando
+                if self._current[4] is None:
+                    self._current[4] = now
+                return
+            self._finish_current(now)
+            self._current = [song_id, duration or 0, time.time(), 0.0, now]
+        self._now_playing = song_id
+        self._wake.set()
+
+    def playing(self):
+        with self._lock:
+            if self._current and self._current[4] is None:
+                self._current[4] = time.monotonic()
+
+    def paused(self):
+        with self._lock:
+            if self._current and self._current[4] is not None:
+                self._current[3] += time.monotonic() - self._current[4]
+                self._current[4] = None
+
+    def track_stopped(self):
+        with self._lock:
+            self._finish_current(time.monotonic())
+            self._current = None
+
+    def _finish_current(self, now):
+        if not self._current:
+            return
+        song_id, duration, started, listened, resumed = self._current
+        if resumed is not None:
+            listened += now - resumed
+        if duration >= SCROBBLE_MIN_TRACK and listened >= min(duration * SCROBBLE_MIN_FRACTION, SCROBBLE_MIN_SECONDS):
+            self._pending.append((song_id, int(started)))
+
+    # --- ENVÍO EN SEGUNDO PLANO ---
+
+    def send_now_playing(self):
+        """Envía el "now playing" más reciente (en cuanto cambia la pista)"""
+        song_id, self._now_playing = self._now_playing, None
+        if song_id is not None:
+            try:
+                self.pool.call("scrobble", song_id, submission=False)
+            except Exception as e:
+                log.debug(event_log.PLAYBACK, f"⚠️ Now playing no enviado: {e}")
+
+    def send_scrobbles(self):
+        """Envía todos los scrobbles pendientes como un lote"""
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        for idx, (song_id, timestamp) in enumerate(batch):
+            try:
+                self.pool.call("scrobble", song_id, submission=True, listenTime=timestamp)
+                self.sent += 1
+            except Exception as e:
+                # Servidor inaccesible: devolvemos el resto a la cola y lo guardamos
+                self._pending.extendleft(reversed(batch[idx:]))
+                self._save()
+                log.warning(event_log.PLAYBACK, f"📴 Scrobbles en espera: {len(self._pending)} ({e})")
+                return
+        if batch:
+            log.debug(event_log.PLAYBACK, f"📤 {len(batch)} scrobbles enviados")
+            self._save()
+
+    def _run(self):
+        # Un cambio de pista despierta el hilo solo para el "now playing":
+        # los scrobbles se agrupan cada self.interval (y al parar)
+        next_batch = time.monotonic() + self.interval
+        while not self._stop.is_set():
+            self._wake.wait(max(next_batch - time.monotonic(), 0))
+            self._wake.clear()
+            self.send_now_playing()
+            if self._stop.is_set() or time.monotonic() >= next_batch:
+                self.send_scrobbles()
+                next_batch = time.monotonic() + self.interval
+
+    def start(self):
+        if self._pending:
+            log.info(event_log.PLAYBACK, f"📬 {len(self._pending)} scrobbles pendientes de otra sesión")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.track_stopped()
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._save()
+
+    # --- PERSISTENCIA ---
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return [tuple(item) for item in json.load(f)]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def _save(self):
+        pending = list(self._pending)
+        # Evitamos reescribir la SD en cada reintento si nada ha cambiado
+        if pending == self._on_disk:
+            return
+        self._on_disk = pending
+        if not pending:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(pending, f)
+        os.replace(tmp_path, self.path)
+
+    def status(self):
+        return {"pending": len(self._pending), "sent": self.sent}
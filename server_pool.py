@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import libsonic
+
+import event_log
+from event_log import log
+
+# --- CONFIGURACIÓN (variables de entorno) ---
+# Timeout por llamada a la API (segundos)
+CALL_TIMEOUT = float(os.getenv("SUBSONIC_TIMEOUT", 5))
+# Reintentos por llamada y espera base del backoff exponencial
+CALL_RETRIES = int(os.getenv("SUBSONIC_RETRIES", 2))
+RETRY_BACKOFF = float(os.getenv("SUBSONIC_RETRY_BACKOFF", 0.2))
+# Intervalo entre pings de salud a cada servidor
+HEALTH_INTERVAL = float(os.getenv("SUBSONIC_HEALTH_INTERVAL", 15))
+# Fallos seguidos que abren el circuito y tiempo hasta volver a probar
+BREAKER_THRESHOLD = int(os.getenv("SUBSONIC_BREAKER_THRESHOLD", 3))
+BREAKER_COOLDOWN = float(os.getenv("SUBSONIC_BREAKER_COOLDOWN", 30))
+
+# Peso de la última medida en la media móvil de latencia
+LATENCY_ALPHA = 0.3
+
+
+class _TimeoutOpener:
+    """Envuelve el opener de urllib de libsonic para imponer un timeout"""
+
+    def __init__(self, opener, timeout):
+        self._opener = opener
+        self._timeout = timeout
+
+    def open(self, req, data=None, timeout=None):
+        return self._opener.open(req, data, timeout or self._timeout)
+
+    def __getattr__(self, name):
+        return getattr(self._opener, name)
+
+
+class Endpoint:
+    """Un servidor Subsonic con su latencia medida y su circuit breaker"""
+
+    def __init__(self, url, default_port, user, password, timeout=CALL_TIMEOUT):
+        parsed = urlparse(url.rstrip("/"))
+        self.url = url
+        port = parsed.port or default_port or (443 if parsed.scheme == "https" else 80)
+        host = f"{parsed.scheme}://{parsed.hostname}"
+        # URL base para los streams (con puerto y ruta si la hubiera)
+        self.base_url = f"{host}:{port}{parsed.path}"
+
+        self.conn = libsonic.Connection(
+            host,
+            user,
+            password,
+            port=int(port),
+            serverPath=f"{parsed.path}/rest",
+            appName="JukePi"
+        )
+        if hasattr(self.conn, "_opener"):
+            self.conn._opener = _TimeoutOpener(self.conn._opener, timeout)
+
+        self.latency = None      # media móvil en segundos
+        self.failures = 0
+        self.opened_at = None    # instante en que se abrió el circuito
+
+    def available(self):
+        """Circuito cerrado, o abierto pero con el enfriamiento cumplido (semiabierto)"""
+        return self.opened_at is None or time.monotonic() - self.opened_at >= BREAKER_COOLDOWN
+
+    def record_success(self, elapsed):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += LATENCY_ALPHA * (elapsed - self.latency)
+        if self.opened_at is not None:
+            log.info(event_log.SYSTEM, f"✅ Servidor {self.url} recuperado")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= BREAKER_THRESHOLD:
+            if self.opened_at is None:
+                log.warning(event_log.SYSTEM, f"🔌 Circuito abierto para {self.url}", failures=self.failures)
+            # Semiabierto que vuelve a fallar: otro periodo de enfriamiento
+            self.opened_at = time.monotonic()
+
+    def status(self):
+        return {
+            "url": self.url,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "failures": self.failures,
+            "open": self.opened_at is not None,
+        }
+
+
+class ServerPool:
+    """
+    Varios servidores Subsonic (SUBSONIC_URL separado por comas, p.ej. la IP
+    de la LAN y la URL pública). Un hilo mide la latencia de cada uno con
+    ping() y las llamadas van siempre al más rápido con el circuito cerrado,
+    con timeout, reintentos con backoff y paso inmediato al siguiente.
+    """
+
+    def __init__(self, urls, port, user, password):
+        self.endpoints = [Endpoint(url, port, user, password) for url in urls]
+        self._stop = threading.Event()
+        self._suspended = threading.Event()
+        self._thread = None
+
+    def best(self, exclude=()):
+        candidates = [ep for ep in self.endpoints if ep.available() and ep not in exclude]
+        if not candidates and exclude:
+            return self.best()
+        if not candidates:
+            # Todos caídos: probamos el que lleva más tiempo abierto
+            return min(self.endpoints, key=lambda ep: ep.opened_at)
+        # Primero los que no han fallado (el circuito tarda en abrirse), luego
+        # por latencia; sin medida todavía = al final, en el orden configurado
+        return min(candidates, key=lambda ep: (ep.failures > 0, ep.latency if ep.latency is not None else float("inf")))
+
+    def call(self, method, *args, **kwargs):
+        """Llama a un método de libsonic.Connection con failover entre servidores"""
+        last_error = None
+        failed = []
+        for attempt in range(CALL_RETRIES + 1):
+            # Primero los servidores que aún no han fallado en esta llamada
+            endpoint = self.best(exclude=failed)
+            if not endpoint.available():
+                # Todos con el circuito abierto: fallamos ya, sin esperar timeouts
+                break
+            start = time.monotonic()
+            try:
+                result = getattr(endpoint.conn, method)(*args, **kwargs)
+                endpoint.record_success(time.monotonic() - start)
+                return result
+            except Exception as e:
+                last_error = e
+                endpoint.record_failure()
+                failed.append(endpoint)
+                log.warning(event_log.FETCH, f"⚠️ {method} falló en {endpoint.url}: {e}", attempt=attempt + 1)
+                # Si queda otro servidor cambiamos ya; si no, esperamos antes de
+                # reintentar, pero solo si su circuito sigue cerrado (un semiabierto
+                # que falla vuelve a abrirse y no se insiste)
+                if self.best(exclude=failed) is endpoint and attempt < CALL_RETRIES:
+                    if not endpoint.available():
+                        break
+                    time.sleep(RETRY_BACKOFF * (2 ** attempt))
+        if last_error is None:
+            raise ConnectionError(f"{method}: todos los servidores Subsonic con el circuito abierto")
+        raise last_error
+
+    def health_check(self):
+        for endpoint in self.endpoints:
+            start = time.monotonic()
+            try:
+                ok = endpoint.conn.ping()
+            except Exception:
+                ok = False
+            if ok:
+                endpoint.record_success(time.monotonic() - start)
+            else:
+                endpoint.record_failure()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._suspended.is_set():
+                self.health_check()
+            self._stop.wait(HEALTH_INTERVAL)
+
+    def start(self):
+        """Primer chequeo síncrono (para elegir ya el servidor) y luego en segundo plano"""
+        self.health_check()
+        if len(self.endpoints) > 1:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def suspend(self):
+        """Detiene los pings (modo reposo)"""
+        self._suspended.set()
+
+    def resume(self):
+        self._suspended.clear()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        return [ep.status() for ep in self.endpoints]
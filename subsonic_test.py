@@ -1,21 +1,29 @@
-import libsonic
-import vlc
-import time
+import argparse
+import json
 import os
-import sys
-import string
 import random
+import string
 import hashlib
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 from dotenv import load_dotenv
 
+from server_pool import Endpoint
+
 # Cargar credenciales
 load_dotenv()
 
 SERVER = os.getenv("SUBSONIC_URL")
+PORT = os.getenv("SUBSONIC_PORT")
 USER = os.getenv("SUBSONIC_USER")
 PASS = os.getenv("SUBSONIC_PASS")
 
+# Tamaño de cada lectura del stream al medir el throughput
+CHUNK_SIZE = 64 * 1024
+
 def generate_salt(length=8):
     """
     Genera un salt aleatorio con letras y números.
@@ -67,73 +75,275 @@ def get_auth(password, salt_length=8):
     token = generate_auth_token(password, salt)
     return token, salt
 
-def main():
-    if not all([SERVER, USER, PASS]):
-        print("Error: Faltan datos en el archivo .env")
-        return
 
-    print(f"📡 Conectando a {SERVER} con usuario {USER}...")
+# -------------------------------
+# Medidas
+# -------------------------------
+def summarize(samples):
+    """
+    Resume una lista de latencias en segundos.
 
-    # 1. Conexión con Subsonic
-    try:
-        conn = libsonic.Connection(SERVER, USER, PASS, port=443, appName="RPiPlayer")
-        if not conn.ping():
-            print("❌ Fallo al conectar con el servidor. Revisa IP y puerto.")
-            return
-        print("✅ Conexión establecida.")
-    except Exception as e:
-        print(f"❌ Error crítico de conexión: {e}")
-        return
+    Returns:
+        dict: n, errores, min/media/p50/p90/p99/max en milisegundos
+    """
+    ok = sorted(s for s in samples if s is not None)
+    result = {"n": len(samples), "errors": len(samples) - len(ok)}
+    if not ok:
+        return result
 
-    # 2. Obtener algo para reproducir (Un álbum aleatorio)
-    print("🔍 Buscando una canción aleatoria...")
-    try:
-        # Pedimos 1 álbum aleatorio
-        first_song = conn.getRandomSongs(size=1)
+    def pct(fraction):
+        return round(ok[min(int(fraction * len(ok)), len(ok) - 1)] * 1000, 1)
 
-    except Exception as e:
-        print(f"❌ Error recuperando datos de Subsonic: {e}")
-        return
+    result.update({
+        "min_ms": round(ok[0] * 1000, 1),
+        "mean_ms": round(sum(ok) / len(ok) * 1000, 1),
+        "p50_ms": pct(0.5),
+        "p90_ms": pct(0.9),
+        "p99_ms": pct(0.99),
+        "max_ms": round(ok[-1] * 1000, 1),
+    })
+    return result
 
-    # 3. Configurar VLC y Reproducir
-    # IMPORTANTE: Construimos la URL manualmente porque VLC necesita acceder
-    # directamente al stream con las credenciales en la URL.
+
+def timed(func, *args, **kwargs):
+    """Duración de una llamada en segundos, o None si falla"""
+    start = time.perf_counter()
     try:
-        song = first_song['randomSongs']['song'][0]
-        token, salt = get_auth(PASS)
-        # _getAuth() genera los parámetros ?u=user&t=token&s=salt&v=version&c=client
-        print(f"Canción {song['title']} con id {song['id']}")
-        auth = conn.stream(song['id'])
-        stream_url = f"{SERVER}/rest/stream?id={song['id']}&u={quote(USER)}&t={token}&s={salt}&v=1.16.1&c=RPiPlayer>
-        print(f"{stream_url}")
-        print("▶ Reproduciendo vía Bluetooth...")
-        # Inicializar VLC
-        instance = vlc.Instance()
-        player = instance.media_player_new()
-        media = instance.media_new(stream_url)
-        player.set_media(media)
-        player.play()
-
-        # Esperar un poco para asegurar que el buffer carga
-        time.sleep(2)
-
-        # Bucle para mantener el script vivo mientras suena la canción
-        duration = song.get('duration', 30) # Si no hay duración, asume 30s
-        print(f"   (Duración aprox: {duration} segundos - Pulsa Ctrl+C para parar)")
+        func(*args, **kwargs)
+    except Exception:
+        return None
+    return time.perf_counter() - start
+
 
+def discover(conn, rng, count):
+    """IDs de álbumes y playlists y términos de búsqueda reales del servidor"""
+    albums = conn.getAlbumList2("random", size=count).get("albumList2", {}).get("album", [])
+    playlists = conn.getPlaylists().get("playlists", {}).get("playlist", [])
+    songs = conn.getRandomSongs(size=count).get("randomSongs", {}).get("song", [])
+    queries = [a.get("artist") or a.get("name") for a in albums if a.get("artist") or a.get("name")]
+    rng.shuffle(queries)
+    return {
+        "albums": [a["id"] for a in albums],
+        "playlists": [p["id"] for p in playlists],
+        "queries": queries,
+        "songs": songs,
+    }
+
+
+def probe_api(conn, targets, samples):
+    """Distribución de latencias de ping y de las llamadas que usa el reproductor"""
+    results = {"ping": summarize([timed(conn.ping) for _ in range(samples)])}
+    calls = (
+        ("getAlbum", conn.getAlbum, targets["albums"]),
+        ("getPlaylist", conn.getPlaylist, targets["playlists"]),
+        ("search3", conn.search3, targets["queries"]),
+    )
+    for name, method, args in calls:
+        if args:
+            results[name] = summarize([timed(method, args[i % len(args)]) for i in range(samples)])
+    return results
+
+
+def stream_url(endpoint, song_id, fmt, bitrate):
+    token, salt = get_auth(PASS)
+    url = (f"{endpoint.base_url}/rest/stream?id={song_id}&u={quote(USER)}"
+           f"&t={token}&s={salt}&v=1.16.1&c=RPiPlayer")
+    if fmt != "raw":
+        url += f"&format={fmt}"
+    if bitrate:
+        url += f"&maxBitRate={bitrate}"
+    return url
+
+
+def probe_stream(url, max_bytes, max_seconds, timeout):
+    """
+    Descarga el principio de un stream.
+
+    Returns:
+        dict: ttfb_ms (hasta los primeros bytes de audio) y kbps sostenidos
+    """
+    start = time.perf_counter()
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        content_type = response.headers.get("Content-Type", "")
+        # read1() vuelve con lo primero que llegue: read() esperaría al bloque
+        # completo (64 KiB son ~4 s de audio a 128 kbps)
+        first = response.read1(CHUNK_SIZE)
+        ttfb = time.perf_counter() - start
+        if content_type.startswith(("text/xml", "application/json")):
+            # Subsonic responde con un error en XML/JSON en lugar de audio
+            raise RuntimeError((first + response.read(200))[:200].decode(errors="replace"))
+        received = 0
+        body_start = time.perf_counter()
+        while received < max_bytes and time.perf_counter() - body_start < max_seconds:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            received += len(chunk)
+        elapsed = time.perf_counter() - body_start
+    return {
+        "ttfb_ms": round(ttfb * 1000, 1),
+        "kbps": round(received * 8 / elapsed / 1000) if elapsed > 0 and received else None,
+        "bytes": received + len(first),
+    }
+
+
+def probe_streams(endpoint, songs, formats, bitrates, args):
+    """TTFB y throughput por formato y bitrate, sobre las mismas canciones"""
+    results = []
+    for fmt in formats:
+        for bitrate in bitrates:
+            ttfbs, rates, errors = [], [], []
+            for song in songs[:args.streams]:
+                try:
+                    r = probe_stream(stream_url(endpoint, song["id"], fmt, bitrate),
+                                     args.stream_bytes, args.stream_seconds, args.timeout)
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                ttfbs.append(r["ttfb_ms"])
+                if r["kbps"]:
+                    rates.append(r["kbps"])
+            results.append({
+                "format": fmt,
+                "max_bitrate": bitrate,
+                "n": len(ttfbs),
+                "errors": len(errors),
+                "ttfb_ms": round(sum(ttfbs) / len(ttfbs), 1) if ttfbs else None,
+                "ttfb_max_ms": max(ttfbs) if ttfbs else None,
+                "kbps": round(sum(rates) / len(rates)) if rates else None,
+                "kbps_min": min(rates) if rates else None,
+                "error": errors[0] if errors else None,
+            })
+    return results
+
+
+def probe_concurrency(conn, targets, levels, requests):
+    """Peticiones por segundo y latencia con N peticiones en paralelo"""
+    albums = targets["albums"]
+    call = (lambda i: conn.getAlbum(albums[i % len(albums)])) if albums else (lambda i: conn.ping())
+    results = []
+    for n in levels:
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            start = time.perf_counter()
+            samples = list(pool.map(lambda i: timed(call, i), range(requests)))
+            elapsed = time.perf_counter() - start
+        result = {"parallel": n, "req_per_s": round(requests / elapsed, 1)}
+        result.update(summarize(samples))
+        results.append(result)
+    return results
+
+
+# -------------------------------
+# Reproducción de prueba (comportamiento original)
+# -------------------------------
+def play_random(conn, endpoint):
+    import vlc
+
+    print("🔍 Buscando una canción aleatoria...")
+    song = conn.getRandomSongs(size=1)['randomSongs']['song'][0]
+    print(f"Canción {song['title']} con id {song['id']}")
+    url = stream_url(endpoint, song['id'], "raw", 0)
+    print("▶ Reproduciendo vía Bluetooth...")
+    instance = vlc.Instance()
+    player = instance.media_player_new()
+    player.set_media(instance.media_new(url))
+    player.play()
+    # Esperar un poco para asegurar que el buffer carga
+    time.sleep(2)
+    print(f"   (Duración aprox: {song.get('duration', 30)} segundos - Pulsa Ctrl+C para parar)")
+    try:
         while player.is_playing():
             time.sleep(1)
-
         print("⏹ Reproducción finalizada.")
-
-    except Exception as e:
-        print(f"❌ Error en VLC: {e}")
     except KeyboardInterrupt:
         print("\n⏹ Deteniendo...")
         player.stop()
 
-if __name__ == "__main__":
-    main()
 
+def print_report(report):
+    print(f"\n📡 {report['server']}")
+    print(f"\n{'llamada':<12} {'n':>4} {'err':>4} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, s in report["api"].items():
+        print(f"{name:<12} {s['n']:>4} {s['errors']:>4} {s.get('p50_ms', '-'):>8} "
+              f"{s.get('p90_ms', '-'):>8} {s.get('p99_ms', '-'):>8} {s.get('max_ms', '-'):>8}")
+
+    if report["streams"]:
+        print(f"\n{'formato':<8} {'bitrate':>8} {'n':>3} {'TTFB ms':>8} {'kbps':>8} {'kbps min':>9}")
+        for s in report["streams"]:
+            print(f"{s['format']:<8} {s['max_bitrate'] or '-':>8} {s['n']:>3} {s['ttfb_ms'] or '-':>8} "
+                  f"{s['kbps'] or '-':>8} {s['kbps_min'] or '-':>9}"
+                  + (f"  ❌ {s['error'][:60]}" if s["error"] else ""))
 
+    if report["concurrency"]:
+        print(f"\n{'paralelo':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'err':>4}")
+        for s in report["concurrency"]:
+            print(f"{s['parallel']:>8} {s['req_per_s']:>8} {s.get('p50_ms', '-'):>8} "
+                  f"{s.get('p99_ms', '-'):>8} {s['errors']:>4}")
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Sonda de rendimiento de un servidor Subsonic/Navidrome")
+    parser.add_argument("--server", help="URL del servidor (por defecto, el primero de SUBSONIC_URL)")
+    parser.add_argument("--samples", type=int, default=20, help="Llamadas por método de la API")
+    parser.add_argument("--formats", default="raw,mp3,opus", help="Formatos de stream (raw = sin transcodificar)")
+    parser.add_argument("--bitrates", default="0,128,320", help="maxBitRate a probar (0 = sin límite)")
+    parser.add_argument("--streams", type=int, default=3, help="Canciones por combinación formato/bitrate")
+    parser.add_argument("--stream-bytes", type=int, default=2_000_000, help="Bytes leídos por stream")
+    parser.add_argument("--stream-seconds", type=float, default=10, help="Tiempo máximo de lectura por stream")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Niveles de paralelismo (vacío = no medir)")
+    parser.add_argument("--requests", type=int, default=32, help="Peticiones por nivel de paralelismo")
+    parser.add_argument("--timeout", type=float, default=15, help="Timeout por petición (segundos)")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla para elegir álbumes y canciones")
+    parser.add_argument("--json", action="store_true", help="Resultado en JSON (una línea)")
+    parser.add_argument("--play", action="store_true", help="Solo reproduce una canción aleatoria con VLC")
+    args = parser.parse_args()
+
+    server = args.server or (SERVER or "").split(",")[0].strip()
+    if not all([server, USER, PASS]):
+        print("Error: Faltan datos en el archivo .env")
+        sys.exit(1)
+
+    # El puerto sale de la URL o de SUBSONIC_PORT, como en el reproductor
+    endpoint = Endpoint(server, PORT, USER, PASS, timeout=args.timeout)
+    conn = endpoint.conn
+    if not args.json:
+        print(f"📡 Conectando a {server} con usuario {USER}...")
+    try:
+        if not conn.ping():
+            print("❌ Fallo al conectar con el servidor. Revisa IP y puerto.")
+            sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error crítico de conexión: {e}")
+        sys.exit(1)
+
+    if args.play:
+        play_random(conn, endpoint)
+        return
+
+    rng = random.Random(args.seed)
+    targets = discover(conn, rng, max(args.samples, args.streams))
+    formats = [f for f in args.formats.split(",") if f]
+    bitrates = [int(b) for b in args.bitrates.split(",") if b]
+    levels = [int(n) for n in args.concurrency.split(",") if n]
+
+    if not args.json:
+        print(f"⏱️ Midiendo API ({args.samples} llamadas por método)...")
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "server": endpoint.base_url,
+        "api": probe_api(conn, targets, args.samples),
+    }
+    if not args.json:
+        print(f"⏱️ Midiendo streams ({len(formats)} formatos x {len(bitrates)} bitrates)...")
+    report["streams"] = probe_streams(endpoint, targets["songs"], formats, bitrates, args)
+    if not args.json and levels:
+        print(f"⏱️ Midiendo concurrencia ({args.requests} peticiones por nivel)...")
+    report["concurrency"] = probe_concurrency(conn, targets, levels, args.requests)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    main()
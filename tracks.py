@@ -0,0 +1,37 @@
+import sys
+
+
+class Track:
+    """
+    Pista de la cola de reproducción con solo los campos que usa el
+    reproductor. Un diccionario de canción de Subsonic trae decenas de
+    campos (carátula, rutas, fechas...); con __slots__ y cadenas internadas
+    una pista ocupa una fracción de esa memoria.
+    """
+    __slots__ = ("id", "duration", "title", "artist", "suffix", "bitrate")
+
+    def __init__(self, id, duration=0, title=None, artist=None, suffix=None, bitrate=0):
+        self.id = id
+        self.duration = duration
+        self.title = title
+        self.artist = artist
+        self.suffix = suffix
+        self.bitrate = bitrate
+
+    @classmethod
+    def from_song(cls, song):
+        artist = song.get("artist")
+        suffix = song.get("suffix")
+        return cls(
+            sys.intern(str(song["id"])),
+            int(song.get("duration") or 0),
+            song.get("title"),
+            # El artista se repite en toda la cola: una sola copia en memoria
+            sys.intern(artist) if artist else None,
+            # Formato y bitrate agrupan la telemetría de reproducción
+            sys.intern(suffix) if suffix else None,
+            int(song.get("bitRate") or 0),
+        )
+
+    def __repr__(self):
+        return f"Track(id={self.id!r}, title={self.title!r}, duration={self.duration})"